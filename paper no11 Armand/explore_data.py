@@ -2,19 +2,24 @@
 Data exploration script to identify variables for Table 2 replication
 """
 
-import pandas as pd
-import numpy as np
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import read_stata_filtered, stata_column_stats, stata_metadata
+
+DATA_FILE = 'Radio_LRA_DB125.dta'
 
 def explore_data():
     """Explore the dataset to identify variables"""
     
-    # Load data
-    df = pd.read_stata('Radio_LRA_DB125.dta')
-    print(f"Dataset shape: {df.shape}")
+    # Header only: variable names, dtypes and labels, no observations loaded
+    meta = stata_metadata(DATA_FILE)
+    columns = meta['variable'].tolist()
+    print(f"Dataset variables: {len(columns)}")
     
-    # Filter for year > 2007
-    df_filtered = df[df['year'] > 2007].copy()
-    print(f"Filtered dataset (year > 2007): {df_filtered.shape}")
+    # Filter for year > 2007 (applied while streaming)
+    year_filter = [('year', '>', 2007)]
     
     # Check for treatment variables (defection messaging)
     print("\n" + "="*60)
@@ -22,11 +27,11 @@ def explore_data():
     print("="*60)
     
     # Look for variables that might be the main treatment
-    treatment_candidates = [col for col in df_filtered.columns if any(word in col.lower() for word in ['messag', 'defect', 'radio', 'main', 'treat'])]
+    treatment_candidates = [col for col in columns if any(word in col.lower() for word in ['messag', 'defect', 'radio', 'main', 'treat'])]
     print(f"Potential treatment variables: {treatment_candidates}")
     
     # Check for intensity variables
-    print(f"\nIntensity variables found: {[col for col in df_filtered.columns if col in ['stdnintensity', 'pctmessaging']]}")
+    print(f"\nIntensity variables found: {[col for col in columns if col in ['stdnintensity', 'pctmessaging']]}")
     
     # Check for control variables
     print("\n" + "="*60)
@@ -34,23 +39,23 @@ def explore_data():
     print("="*60)
     
     # Distance controls
-    dist_controls = [col for col in df_filtered.columns if 'dist' in col.lower()]
+    dist_controls = [col for col in columns if 'dist' in col.lower()]
     print(f"Distance controls: {dist_controls}")
     
     # Visual/non-visual controls
-    vis_controls = [col for col in df_filtered.columns if any(word in col.lower() for word in ['vis', 'nvis'])]
+    vis_controls = [col for col in columns if any(word in col.lower() for word in ['vis', 'nvis'])]
     print(f"Visual/non-visual controls: {vis_controls}")
     
     # Geographic controls
-    geo_controls = [col for col in df_filtered.columns if any(word in col.lower() for word in ['geo', 'sel', 'region', 'country'])]
+    geo_controls = [col for col in columns if any(word in col.lower() for word in ['geo', 'sel', 'region', 'country'])]
     print(f"Geographic controls: {geo_controls}")
     
     # Circular coverage
-    circ_controls = [col for col in df_filtered.columns if 'circ' in col.lower()]
+    circ_controls = [col for col in columns if 'circ' in col.lower()]
     print(f"Circular coverage controls: {circ_controls}")
     
     # Variable-specific trends
-    trend_controls = [col for col in df_filtered.columns if any(word in col.lower() for word in ['trend', 'year', 'rugged', 'nlights', 'pop', 'urban', 'forest'])]
+    trend_controls = [col for col in columns if any(word in col.lower() for word in ['trend', 'year', 'rugged', 'nlights', 'pop', 'urban', 'forest'])]
     print(f"Trend controls: {trend_controls}")
     
     # Check for dependent variables
@@ -59,28 +64,32 @@ def explore_data():
     print("="*60)
     
     dep_vars = ['lnC_LRAfatalities', 'lnA_LRAfatalities', 'lnB_LRAfatalities', 'ln_LRAfatalities']
-    available_dep_vars = [var for var in dep_vars if var in df_filtered.columns]
+    available_dep_vars = [var for var in dep_vars if var in columns]
     print(f"Available dependent variables: {available_dep_vars}")
     
+    # Summary statistics for the outcomes and panel identifiers in one streaming pass
+    stats = stata_column_stats(DATA_FILE, available_dep_vars + ['cell_id', 'year'], filters=year_filter)
+    print(f"Filtered dataset (year > 2007): {stats['non_missing'].get('year', 0)} observations")
+    
     # Check sample statistics for dependent variables
     for var in available_dep_vars:
         print(f"\n{var}:")
-        print(f"  Mean: {df_filtered[var].mean():.3f}")
-        print(f"  Std: {df_filtered[var].std():.3f}")
-        print(f"  Min: {df_filtered[var].min():.3f}")
-        print(f"  Max: {df_filtered[var].max():.3f}")
-        print(f"  Non-missing: {df_filtered[var].count()}")
+        print(f"  Mean: {stats.loc[var, 'mean']:.3f}")
+        print(f"  Std: {stats.loc[var, 'std']:.3f}")
+        print(f"  Min: {stats.loc[var, 'min']:.3f}")
+        print(f"  Max: {stats.loc[var, 'max']:.3f}")
+        print(f"  Non-missing: {stats.loc[var, 'non_missing']}")
     
     # Check for panel structure
     print("\n" + "="*60)
     print("PANEL STRUCTURE")
     print("="*60)
     
-    if 'cell_id' in df_filtered.columns:
-        print(f"Number of unique cells: {df_filtered['cell_id'].nunique()}")
-    if 'year' in df_filtered.columns:
-        print(f"Year range: {df_filtered['year'].min()} - {df_filtered['year'].max()}")
-        print(f"Number of unique years: {df_filtered['year'].nunique()}")
+    if 'cell_id' in stats.index:
+        print(f"Number of unique cells: {stats.loc['cell_id', 'nunique']}")
+    if 'year' in stats.index:
+        print(f"Year range: {stats.loc['year', 'min']} - {stats.loc['year', 'max']}")
+        print(f"Number of unique years: {stats.loc['year', 'nunique']}")
     
     # Show first few rows of key variables
     print("\n" + "="*60)
@@ -88,9 +97,9 @@ def explore_data():
     print("="*60)
     
     key_vars = ['cell_id', 'year'] + available_dep_vars + treatment_candidates + ['stdnintensity', 'pctmessaging']
-    key_vars = [var for var in key_vars if var in df_filtered.columns]
+    key_vars = list(dict.fromkeys(var for var in key_vars if var in columns))
     
-    print(df_filtered[key_vars].head())
+    print(read_stata_filtered(DATA_FILE, key_vars, filters=year_filter, nrows=5))
 
 if __name__ == "__main__":
     explore_data() 
\ No newline at end of file
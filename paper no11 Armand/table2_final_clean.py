@@ -4,48 +4,80 @@ Python equivalent of the Stata code for Table 2
 Authors: Armand et al.
 """
 
-import pandas as pd
-import numpy as np
-import statsmodels.api as sm
-from linearmodels import PanelOLS
+import os
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import WithinOLS, read_stata_cached
+
 warnings.filterwarnings('ignore')
 
 def load_and_prepare_data():
     """Load and prepare the regression data"""
     try:
-        df = pd.read_stata('Radio_LRA_DB125.dta')
+        df = read_stata_cached('Radio_LRA_DB125.dta', id_columns=['cell_id'])
         return df
     except FileNotFoundError:
         print("Data file not found: Radio_LRA_DB125.dta")
         return None
 
-def run_fixed_effects_regression(df, dependent_var, independent_vars):
-    """Run fixed effects regression (equivalent to Stata's xtreg with fe robust)"""
-    
-    # Prepare data
-    y = df[dependent_var].astype(float)
-    X = df[independent_vars].astype(float)
-    
-    # Create panel data structure
-    panel_data = pd.DataFrame({
-        'y': y,
-        'entity': df['cell_id'],
-        'time': df['year']
-    })
-    
-    # Add independent variables
-    for col in X.columns:
-        panel_data[col] = X[col]
-    
-    # Set panel structure
-    panel_data = panel_data.set_index(['entity', 'time'])
-    
-    # Run fixed effects regression
-    model = PanelOLS.from_formula('y ~ ' + ' + '.join(independent_vars), data=panel_data, 
-                                 other_effects='entity')
-    results = model.fit(cov_type='robust')
-    return results
+def run_nested_fixed_effects(df, dependent_vars, specs):
+    """Cell fixed-effects regressions (Stata's xtreg, fe robust) for nested specs
+
+    `specs` maps a spec name to its regressor blocks, shared leading blocks
+    first. Specs and outcomes with the same complete rows share one
+    WithinOLS: every column they use is demeaned by cell once, and the
+    blocks the specs have in common are factorized once. Standard errors
+    cluster by cell, as xtreg's robust option does. Regressors the cell
+    effects absorb are omitted, as xtreg omits them.
+
+    Returns ({dependent_var: {spec: results}}, omitted regressors).
+    """
+    samples = {}
+    for dep_var in dependent_vars:
+        for spec, blocks in specs.items():
+            regressors = [var for block in blocks for var in block]
+            mask = df[[dep_var] + regressors].notna().all(axis=1).to_numpy()
+            samples.setdefault(mask.tobytes(), (mask, {}))[1].setdefault(spec, []).append(dep_var)
+
+    results = {dep_var: {} for dep_var in dependent_vars}
+    omitted = []
+    for mask, spec_outcomes in samples.values():
+        sample = df[mask]
+        regressors = list(dict.fromkeys(var for spec in spec_outcomes for block in specs[spec] for var in block))
+        outcomes = list(dict.fromkeys(dep_var for deps in spec_outcomes.values() for dep_var in deps))
+        model = WithinOLS(sample, ['cell_id'], regressors, outcomes, cluster='cell_id')
+        omitted += [var for var in model.omitted if var not in omitted]
+        for spec, deps in spec_outcomes.items():
+            try:
+                for dep_var, fit in model.fit(*specs[spec], outcomes=deps).items():
+                    results[dep_var][spec] = fit
+            except Exception as e:
+                print(f"Error in {spec}: {e}")
+    return results, omitted
+
+def check_against_panelols(df, dep_var, blocks, fit):
+    """Check one spec against linearmodels' PanelOLS with cell effects
+
+    Debugging aid, run only when REPLICATION_CHECK is set. PanelOLS gets
+    the regressors left after omission. Its unadjusted clustered SEs times
+    xtreg's (N-1)/(N-K) * G/(G-1), with K counting only those regressors,
+    should give ours.
+    """
+    from linearmodels.panel import PanelOLS
+
+    regressors = list(fit.params.index)
+    sample = df.dropna(subset=[dep_var] + [var for block in blocks for var in block]).set_index(['cell_id', 'year'])
+    panel = PanelOLS(sample[dep_var], sample[regressors], entity_effects=True).fit(
+        cov_type='clustered', cluster_entity=True, debiased=False)
+    n, k = len(sample), len(regressors)
+    g = sample.index.get_level_values('cell_id').nunique()
+    expected_se = panel.std_errors[regressors] * ((n - 1) / (n - k) * g / (g - 1)) ** 0.5
+    assert fit.df_resid == n - k, (fit.df_resid, n - k)
+    assert (fit.params - panel.params[regressors]).abs().max() < 1e-8
+    assert ((fit.bse - expected_se) / expected_se).abs().max() < 1e-8
 
 def main():
     """Main replication function"""
@@ -83,80 +115,44 @@ def main():
     circ_controls = ['circcovered']
     available_circ_controls = [var for var in circ_controls if var in df_filtered.columns]
     
+    # Year dummies that vary in the sample, less one base year (collinear with the cell effects)
+    year_dummies = [col for col in year_dummies if df_filtered[col].nunique() > 1][1:]
+    
+    # Nested specifications: distance controls first, then year dummies and/or
+    # trends, with the treatment last so specs share their leading blocks
+    specs = {}
+    if main_treatment in df_filtered.columns:
+        # Specification 1: Benchmark
+        specs['benchmark'] = [available_dist_controls, available_trend_controls, [main_treatment]]
+        if year_dummies:
+            # Specification 2: Basic controls
+            specs['basic'] = [available_dist_controls, year_dummies, [main_treatment]]
+            # Specification 3: Basic and additional controls
+            specs['basic_additional'] = [available_dist_controls, year_dummies, available_trend_controls,
+                                         [main_treatment]]
+    # Alternative intensity measures
+    for intensity_var in available_intensity_vars:
+        specs[f'intensity_{intensity_var}'] = [available_dist_controls, available_trend_controls, [intensity_var]]
+    
+    fits, omitted = run_nested_fixed_effects(df_filtered, available_dep_vars, specs)
+    for var in omitted:
+        print(f"note: {var} omitted because of collinearity with the cell effects")
+    if os.environ.get('REPLICATION_CHECK') and 'benchmark' in specs and available_dep_vars:
+        check_against_panelols(df_filtered, available_dep_vars[0], specs['benchmark'],
+                               fits[available_dep_vars[0]]['benchmark'])
+    
     # Results storage
     results_summary = {}
-    
-    # Run regressions for each dependent variable
     for dep_var in available_dep_vars:
         results_summary[dep_var] = {}
-        
-        # Specification 1: Benchmark
-        if main_treatment in df_filtered.columns:
-            controls_1 = available_dist_controls + available_trend_controls
-            
-            try:
-                results_1 = run_fixed_effects_regression(df_filtered, dep_var, 
-                                                       [main_treatment] + controls_1)
-                
-                results_summary[dep_var]['benchmark'] = {
-                    'treatment_coef': results_1.params[main_treatment],
-                    'treatment_se': results_1.std_errors[main_treatment],
-                    'r2': results_1.rsquared,
-                    'nobs': results_1.nobs
-                }
-            except Exception as e:
-                print(f"Error in {dep_var} benchmark: {e}")
-        
-        # Specification 2: Basic controls
-        if main_treatment in df_filtered.columns and year_dummies:
-            controls_2 = available_dist_controls + year_dummies
-            
-            try:
-                results_2 = run_fixed_effects_regression(df_filtered, dep_var, 
-                                                       [main_treatment] + controls_2)
-                
-                results_summary[dep_var]['basic'] = {
-                    'treatment_coef': results_2.params[main_treatment],
-                    'treatment_se': results_2.std_errors[main_treatment],
-                    'r2': results_2.rsquared,
-                    'nobs': results_2.nobs
-                }
-            except Exception as e:
-                print(f"Error in {dep_var} basic: {e}")
-        
-        # Specification 3: Basic and additional controls
-        if main_treatment in df_filtered.columns and year_dummies:
-            controls_3 = available_dist_controls + year_dummies + available_trend_controls
-            
-            try:
-                results_3 = run_fixed_effects_regression(df_filtered, dep_var, 
-                                                       [main_treatment] + controls_3)
-                
-                results_summary[dep_var]['basic_additional'] = {
-                    'treatment_coef': results_3.params[main_treatment],
-                    'treatment_se': results_3.std_errors[main_treatment],
-                    'r2': results_3.rsquared,
-                    'nobs': results_3.nobs
-                }
-            except Exception as e:
-                print(f"Error in {dep_var} basic_additional: {e}")
-        
-        # Alternative intensity measures
-        for intensity_var in available_intensity_vars:
-            controls_intensity = available_dist_controls + available_trend_controls
-            
-            try:
-                results_intensity = run_fixed_effects_regression(df_filtered, dep_var, 
-                                                               [intensity_var] + controls_intensity)
-                
-                results_summary[dep_var][f'intensity_{intensity_var}'] = {
-                    'treatment_coef': results_intensity.params[intensity_var],
-                    'treatment_se': results_intensity.std_errors[intensity_var],
-                    'r2': results_intensity.rsquared,
-                    'nobs': results_intensity.nobs
-                }
-            except Exception as e:
-                print(f"Error in {dep_var} {intensity_var}: {e}")
+        for spec, fit in fits[dep_var].items():
+            treatment = specs[spec][-1][0]
+            results_summary[dep_var][spec] = {
+                'treatment_coef': fit.params[treatment],
+                'treatment_se': fit.bse[treatment],
+                'r2': fit.rsquared,
+                'nobs': int(fit.nobs)
+            }
     
     # Results table
     print("=" * 80)
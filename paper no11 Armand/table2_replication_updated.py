@@ -14,12 +14,18 @@ import numpy as np
 import statsmodels.api as sm
 from linearmodels import PanelOLS
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import read_stata_cached
+
 warnings.filterwarnings('ignore')
 
 def load_and_prepare_data():
     """Load and prepare the regression data"""
     try:
-        df = pd.read_stata('Radio_LRA_DB125.dta')
+        df = read_stata_cached('Radio_LRA_DB125.dta')
         return df
     except FileNotFoundError:
         print("Data file not found: Radio_LRA_DB125.dta")
@@ -0,0 +1,141 @@
+"""
+Small lazy join planner for the Nielsen merge in replicate_table4
+Pushes per-table predicates below the joins, reduces every input with
+semi-joins on the join keys, and only then runs the wide merges
+"""
+
+import pandas as pd
+
+# Rows sampled to estimate predicate selectivity
+SAMPLE_ROWS = 10_000
+
+
+def _key_index(df, on):
+    """Hashable view of the join keys, one entry per row"""
+    if len(on) == 1:
+        return pd.Index(df[on[0]])
+    return pd.MultiIndex.from_frame(df[on])
+
+
+def _semi_join(df, other, on):
+    """Rows of df whose keys appear in other"""
+    keys = _key_index(other, on).unique()
+    return df[_key_index(df, on).isin(keys)]
+
+
+def _ndv(df, on):
+    return max(len(df[on].drop_duplicates()), 1)
+
+
+class JoinPlan:
+    """Lazily planned chain of scans, filters and joins
+
+    Inputs are registered with scan(), predicates with where() (each bound
+    to one input), and joins with join() in the order the result should be
+    built. Nothing runs until execute(), which
+
+    1. applies each input's predicates before any join,
+    2. semi-joins the inputs of every inner join against each other on the
+       join keys (a forward and a backward pass over the chain), and
+    3. runs the merges on the reduced inputs.
+
+    explain() prints the plan with estimated row counts per step.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.inputs = {}
+        self.predicates = []
+        self.joins = []
+
+    def scan(self, name, df):
+        self.inputs[name] = df
+        return self
+
+    def where(self, name, label, predicate):
+        """Filter input `name` with predicate(df) -> boolean mask"""
+        self.predicates.append((name, label, predicate))
+        return self
+
+    def join(self, name, on, how='inner'):
+        """Merge input `name` onto the result built so far"""
+        on = [on] if isinstance(on, str) else list(on)
+        self.joins.append((name, on, how))
+        return self
+
+    def _owner(self, on, before):
+        """Earliest input in the chain that provides all of the join keys"""
+        for name in [self.base] + [j[0] for j in self.joins[:before]]:
+            if all(col in self.inputs[name].columns for col in on):
+                return name
+        raise KeyError(f"No earlier input provides join keys {on}")
+
+    def _semi_join_pairs(self):
+        """(reduced input, reducing input, keys) for the forward pass"""
+        pairs = []
+        for i, (name, on, how) in enumerate(self.joins):
+            owner = self._owner(on, i)
+            pairs.append((name, owner, on))
+            if how == 'inner':
+                pairs.append((owner, name, on))
+        return pairs
+
+    def _estimate(self):
+        """Estimated rows per step from input sizes, sampled selectivities and key cardinalities"""
+        rows = {name: float(len(df)) for name, df in self.inputs.items()}
+        steps = []
+        for name, label, predicate in self.predicates:
+            df = self.inputs[name]
+            sample = df.sample(min(len(df), SAMPLE_ROWS), random_state=0) if len(df) else df
+            selectivity = float(predicate(sample).mean()) if len(sample) else 0.0
+            rows[name] *= selectivity
+            steps.append((f"filter {name}: {label}", rows[name]))
+        ndv = {}
+        for name, owner, on in self._semi_join_pairs():
+            n_self = ndv.setdefault((name, tuple(on)), _ndv(self.inputs[name], on))
+            n_other = ndv.setdefault((owner, tuple(on)), _ndv(self.inputs[owner], on))
+            # Assume the other side's filters removed keys in proportion to rows
+            surviving = n_other * rows[owner] / max(len(self.inputs[owner]), 1)
+            rows[name] *= min(1.0, surviving / n_self)
+            steps.append((f"semi-join {name} on {', '.join(on)} with {owner}", rows[name]))
+        result = rows[self.base]
+        for name, on, how in self.joins:
+            n_key = max(ndv.get((name, tuple(on)), 1), 1)
+            joined = result * rows[name] / n_key
+            result = max(joined, result) if how == 'left' else joined
+            steps.append((f"{how} join {name} on {', '.join(on)}", result))
+        return steps
+
+    def explain(self):
+        print("Join plan (estimated rows):")
+        for label, rows in self._estimate():
+            print(f"  {label:<60} {rows:>14,.0f}")
+
+    def execute(self, verbose=True):
+        """Run the plan and return the joined frame"""
+        if verbose:
+            self.explain()
+            print("Executed (actual rows):")
+        frames = dict(self.inputs)
+
+        def log(label, df):
+            if verbose:
+                print(f"  {label:<60} {len(df):>14,}")
+
+        for name, label, predicate in self.predicates:
+            frames[name] = frames[name][predicate(frames[name])]
+            log(f"filter {name}: {label}", frames[name])
+
+        # Forward then backward pass so reductions propagate along the whole chain
+        pairs = self._semi_join_pairs()
+        for name, owner, on in pairs + pairs[::-1]:
+            reduced = _semi_join(frames[name], frames[owner], on)
+            if len(reduced) < len(frames[name]):
+                frames[name] = reduced
+                log(f"semi-join {name} on {', '.join(on)} with {owner}", reduced)
+
+        df = frames[self.base]
+        for name, on, how in self.joins:
+            df = df.merge(frames[name], on=on, how=how)
+            log(f"{how} join {name} on {', '.join(on)}", df)
+        return df
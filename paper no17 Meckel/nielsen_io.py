@@ -0,0 +1,206 @@
+"""
+Nielsen Consumer Panel ingestion for the Table 4 replication
+Typed, column-projected, parallel reads of the yearly TSV shards, and a
+Parquet store partitioned by panel year and state with filter pushdown
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+NIELSEN_YEARS = range(2004, 2010)
+
+# Columns and dtypes used by replicate_table4, per file type
+NIELSEN_SCHEMAS = {
+    'panel': {
+        'household_id': 'int64',
+        'panel_year': 'int16',
+        'fips_state_desc': 'category',
+        'panelist_zip_code': 'int32',
+    },
+    'trips': {
+        'trip_id_uc': 'int64',
+        'household_id': 'int64',
+        'panel_year': 'int16',
+        'purchase_date': 'datetime',
+        'retailer_id': 'int32',
+        'store_id_uc': 'float64',  # missing for stores Nielsen cannot identify
+    },
+    'purchases': {
+        'trip_id_uc': 'int64',
+        'upc': 'int64',
+        'upc_ver': 'int8',
+        'quantity': 'int32',
+        'total_price_paid': 'float64',
+        'coupon_value': 'float64',
+    },
+    'products_extra': {
+        'upc': 'int64',
+        'upc_ver_uc': 'int8',
+        'flavor_descr': 'category',
+        'container_descr': 'category',
+        'style_descr': 'category',
+        'type_descr': 'category',
+        'product_descr': 'category',
+    },
+}
+
+
+def _csv_engine():
+    """pyarrow's multi-threaded parser when available, else pandas' C parser"""
+    try:
+        import pyarrow  # noqa: F401
+        return 'pyarrow'
+    except ImportError:
+        return 'c'
+
+
+def shard_path(file_type, year, data_dir='.'):
+    return os.path.join(data_dir, f'{file_type}_{year % 100:02d}.tsv')
+
+
+def read_nielsen_shard(file_type, year, data_dir='.'):
+    """Read one yearly TSV with the declared columns and dtypes"""
+    schema = NIELSEN_SCHEMAS[file_type]
+    dates = [col for col, dtype in schema.items() if dtype == 'datetime']
+    dtypes = {col: dtype for col, dtype in schema.items() if dtype != 'datetime'}
+    df = pd.read_csv(shard_path(file_type, year, data_dir), sep='\t', engine=_csv_engine(),
+                     usecols=list(schema), dtype=dtypes, parse_dates=dates or None)
+    if file_type == 'panel':
+        df['year'] = year
+    return df
+
+
+def _concat_shards(frames):
+    """Concatenate shards, merging category levels instead of falling back to object"""
+    df = pd.concat(frames, ignore_index=True)
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            df[col] = union_categoricals([f[col] for f in frames], ignore_order=True)
+    return df
+
+
+def load_nielsen(file_types=('panel', 'trips', 'purchases', 'products_extra'),
+                 years=NIELSEN_YEARS, data_dir='.', max_workers=None):
+    """Read all shards of the given file types in parallel
+
+    Returns {file_type: concatenated DataFrame}. Shards are parsed on a
+    thread pool (the parsers release the GIL), so the load is bounded by
+    disk bandwidth rather than a single parsing thread.
+    """
+    jobs = [(file_type, year) for file_type in file_types for year in years]
+    max_workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        shards = list(pool.map(lambda job: read_nielsen_shard(*job, data_dir=data_dir), jobs))
+
+    frames = {file_type: [] for file_type in file_types}
+    for (file_type, _), df in zip(jobs, shards):
+        frames[file_type].append(df)
+    return {file_type: _concat_shards(dfs) for file_type, dfs in frames.items()}
+
+
+# Partition keys of the Parquet store; trips and purchases inherit the
+# household's state when the store is built
+STORE_PARTITIONS = ['panel_year', 'fips_state_desc']
+STORE_FILE_TYPES = ('panel', 'trips', 'purchases')
+# Sort key inside each partition, so row-group min/max statistics can skip
+# purchase dates (trips) and UPCs (purchases) outside the requested range
+STORE_SORT_KEYS = {'panel': 'household_id', 'trips': 'purchase_date', 'purchases': 'upc'}
+STORE_ROW_GROUP = 128_000
+
+
+def _store_year(year, data_dir):
+    """Panel, trips and purchases for one year with the partition keys attached"""
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        panel, trips, purchases = pool.map(lambda t: read_nielsen_shard(t, year, data_dir),
+                                           STORE_FILE_TYPES)
+
+    households = panel[['panel_year', 'household_id', 'fips_state_desc']]
+    trips = trips.merge(households, on=['panel_year', 'household_id'], how='left')
+    purchases = purchases.merge(trips[['trip_id_uc'] + STORE_PARTITIONS], on='trip_id_uc',
+                                how='left')
+    frames = {'panel': panel, 'trips': trips, 'purchases': purchases}
+    for file_type, df in frames.items():
+        df = df.sort_values(STORE_SORT_KEYS[file_type], kind='stable')
+        df['fips_state_desc'] = df['fips_state_desc'].astype(str)
+        frames[file_type] = df
+    return frames
+
+
+def build_nielsen_store(store_dir, data_dir='.', years=NIELSEN_YEARS):
+    """One-time conversion of the TSV shards into a partitioned Parquet store
+
+    Writes <store_dir>/<file_type>/panel_year=YYYY/fips_state_desc=XX/*.parquet
+    for panel, trips and purchases, one year at a time to bound memory.
+    The store is built in <store_dir>.tmp and renamed into place when every
+    year is written, so an existing `store_dir` is always complete.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    tmp_dir = f'{os.path.normpath(store_dir)}.tmp'
+    # Leftovers of an interrupted build
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for year in years:
+        frames = _store_year(year, data_dir)
+        for file_type, df in frames.items():
+            ds.write_dataset(
+                pa.Table.from_pandas(df, preserve_index=False),
+                os.path.join(tmp_dir, file_type),
+                format='parquet',
+                partitioning=STORE_PARTITIONS,
+                partitioning_flavor='hive',
+                basename_template=f'{year}-{{i}}.parquet',
+                existing_data_behavior='overwrite_or_ignore',
+                max_rows_per_group=STORE_ROW_GROUP,
+                min_rows_per_group=STORE_ROW_GROUP // 4,
+            )
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+
+
+def read_nielsen_store(file_type, store_dir, states=None, years=None, start=None, end=None,
+                       upcs=None, columns=None):
+    """Read one file type from the Parquet store with predicate pushdown
+
+    states/years prune whole partitions; start/end (inclusive dates, trips
+    only) and upcs (purchases only) are checked against row-group
+    statistics before any data is decoded. Returns the schema columns (or
+    `columns`) with the same dtypes as read_nielsen_shard.
+    """
+    import pyarrow.dataset as ds
+
+    if (start is not None or end is not None) and file_type != 'trips':
+        raise ValueError("Date filters apply to trips only")
+    if upcs is not None and file_type != 'purchases':
+        raise ValueError("UPC filters apply to purchases only")
+
+    dataset = ds.dataset(os.path.join(store_dir, file_type), format='parquet',
+                         partitioning='hive')
+    predicates = []
+    if states is not None:
+        predicates.append(ds.field('fips_state_desc').isin(list(states)))
+    if years is not None:
+        predicates.append(ds.field('panel_year').isin([int(y) for y in years]))
+    if start is not None:
+        predicates.append(ds.field('purchase_date') >= pd.Timestamp(start))
+    if end is not None:
+        predicates.append(ds.field('purchase_date') <= pd.Timestamp(end))
+    if upcs is not None:
+        predicates.append(ds.field('upc').isin([int(u) for u in upcs]))
+    expression = None
+    for predicate in predicates:
+        expression = predicate if expression is None else expression & predicate
+
+    if columns is None:
+        columns = list(NIELSEN_SCHEMAS[file_type]) + (['year'] if file_type == 'panel' else [])
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    # Partition keys come back as plain strings/ints; restore the schema dtypes
+    for col in STORE_PARTITIONS:
+        if col in df.columns:
+            df[col] = df[col].astype(NIELSEN_SCHEMAS['panel'][col])
+    return df
@@ -2,60 +2,76 @@ import pandas as pd
 import numpy as np
 from linearmodels import PanelOLS
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import drop_singletons, fe_codes, read_stata_cached
+from nielsen_io import build_nielsen_store, load_nielsen, read_nielsen_store
+from join_plan import JoinPlan
+
 warnings.filterwarnings('ignore')
 
+# Partitioned Parquet copy of the Nielsen panel/trips/purchases shards
+NIELSEN_STORE = 'nielsen_parquet'
+
+WIC_PRODUCT_GROUPS = ['VEGETABLES - CANNED', 'BABY FOOD', 'EGGS', 
+                      'FRESH PRODUCE', 'JAMS, JELLIES, SPREADS', 
+                      'SEAFOOD - CANNED', 'VEGETABLES AND GRAINS - DRIED']
+
+# Fiscal years 2007-2009 (October 2006 - September 2009)
+PANEL_YEARS = range(2006, 2010)
+PURCHASE_START, PURCHASE_END = '2006-10-01', '2009-09-30'
+
 def replicate_table4():
-    # Load Nielsen raw data files
-    dfs = []
-    
-    # Read and combine products_extra files
-    products_extra = []
-    for x in range(4, 10):
-        df = pd.read_csv(f'products_extra_0{x}.tsv', sep='\t')
-        products_extra.append(df)
-    products_extra = pd.concat(products_extra, ignore_index=True)
-    products_extra = products_extra[['upc', 'upc_ver_uc', 'flavor_descr', 'container_descr', 
-                                   'style_descr', 'type_descr', 'product_descr']].drop_duplicates()
-    
-    # Read and combine main files
-    for file_type in ['panel', 'purchases', 'trips']:
-        file_dfs = []
-        for x in range(4, 10):
-            df = pd.read_csv(f'{file_type}_0{x}.tsv', sep='\t')
-            if file_type == 'panel':
-                df['year'] = 2000 + x
-            file_dfs.append(df)
-        globals()[file_type] = pd.concat(file_dfs, ignore_index=True)
+    # One-time conversion of the raw TSV shards (the store directory only
+    # appears once the build has finished, so its presence means complete)
+    if not Path(NIELSEN_STORE).is_dir():
+        build_nielsen_store(NIELSEN_STORE)
     
     # Read products and retailers
     products = pd.read_csv('products_transformed.tsv', sep='\t')
-    upc_versions = pd.read_stata('upc_versions.dta')
+    upc_versions = read_stata_cached('upc_versions.dta')
     products = products.merge(upc_versions, on=['upc', 'upc_ver'], how='inner')
+    wic_group_upcs = products.loc[products['product_group_descr'].isin(WIC_PRODUCT_GROUPS), 'upc'].unique()
     
     retailers = pd.read_csv('retailers.tsv', sep='\t')
     
-    # Convert purchase_date
-    trips['purchase_date'] = pd.to_datetime(trips['purchase_date'])
-    
-    # Build analysis dataset
-    df = (panel[panel['fips_state_desc'] == 'TX']
-          .merge(trips, on=['panel_year', 'household_id'])
-          .merge(purchases, on='trip_id_uc')
-          .merge(products, on=['upc', 'upc_ver']))
-    
-    # Filter to relevant product groups
-    df = df[df['product_group_descr'].isin(['VEGETABLES - CANNED', 'BABY FOOD', 'EGGS', 
-                                           'FRESH PRODUCE', 'JAMS, JELLIES, SPREADS', 
-                                           'SEAFOOD - CANNED', 'VEGETABLES AND GRAINS - DRIED'])]
-    
-    # Create fiscal year filter
-    df['pyear'] = df['purchase_date'].dt.year
-    df['pmonth'] = df['purchase_date'].dt.month
-    df['purchase_ym'] = df['pyear'] * 100 + df['pmonth']
-    df = df[(df['purchase_ym'] >= 200610) & (df['purchase_ym'] <= 200909)]
-    
-    # Merge products_extra
-    df = df.merge(products_extra, on=['upc', 'upc_ver'], how='left')
+    # Load only Texas households, in-window trips and WIC product group purchases;
+    # state/year prune partitions, dates and UPCs prune row groups
+    panel = read_nielsen_store('panel', NIELSEN_STORE, states=['TX'], years=PANEL_YEARS)
+    trips = read_nielsen_store('trips', NIELSEN_STORE, states=['TX'], years=PANEL_YEARS,
+                               start=PURCHASE_START, end=PURCHASE_END)
+    purchases = read_nielsen_store('purchases', NIELSEN_STORE, states=['TX'], years=PANEL_YEARS,
+                                   upcs=wic_group_upcs)
+    products_extra = load_nielsen(file_types=('products_extra',))['products_extra'].drop_duplicates()
+    
+    # products_extra names the UPC version upc_ver_uc
+    products_extra = products_extra.rename(columns={'upc_ver_uc': 'upc_ver'})
+    
+    # Fiscal year window on the trip date
+    trips['pyear'] = trips['purchase_date'].dt.year
+    trips['pmonth'] = trips['purchase_date'].dt.month
+    trips['purchase_ym'] = trips['pyear'] * 100 + trips['pmonth']
+    
+    # Build analysis dataset: predicates and semi-joins on the join keys run
+    # before the wide merges (see join_plan.JoinPlan)
+    plan = (JoinPlan('panel')
+            .scan('panel', panel)
+            .scan('trips', trips)
+            .scan('purchases', purchases)
+            .scan('products', products)
+            .scan('products_extra', products_extra)
+            .where('panel', "fips_state_desc == 'TX'", lambda d: d['fips_state_desc'] == 'TX')
+            .where('trips', 'purchase_ym in 200610-200909',
+                   lambda d: (d['purchase_ym'] >= 200610) & (d['purchase_ym'] <= 200909))
+            .where('products', 'WIC product groups',
+                   lambda d: d['product_group_descr'].isin(WIC_PRODUCT_GROUPS))
+            .join('trips', on=['panel_year', 'household_id'])
+            .join('purchases', on='trip_id_uc')
+            .join('products', on=['upc', 'upc_ver'])
+            .join('products_extra', on=['upc', 'upc_ver'], how='left'))
+    df = plan.execute()
     
     # Code WIC-eligible products
     df = code_wic_products(df)
@@ -65,8 +81,9 @@ def replicate_table4():
     df['lfinalprice_perunit'] = np.log(df['finalprice_perunit'])
     df = df.dropna(subset=['lfinalprice_perunit'])
     
-    # Store size indicator
-    store_info = (trips[['store_id_uc', 'retailer_id']].drop_duplicates()
+    # Store size indicator (counts stores over all trips, not just the Texas window)
+    all_stores = read_nielsen_store('trips', NIELSEN_STORE, columns=['store_id_uc', 'retailer_id'])
+    store_info = (all_stores.drop_duplicates()
                   .merge(retailers, on='retailer_id'))
     store_counts = store_info.groupby('retailer_id').size().reset_index(columns=['total_stores'])
     store_info = store_info.merge(store_counts, on='retailer_id')
@@ -74,9 +91,9 @@ def replicate_table4():
                   on=['store_id_uc', 'retailer_id'])
     
     # Load auxiliary data files
-    zip2county = pd.read_stata('../OtherData/zip2county_tx.dta')
-    county_names = pd.read_stata('../OtherData/fips2cntyname.dta')
-    ebt_dates = pd.read_stata('../OtherData/ebt_dates.dta')
+    zip2county = read_stata_cached('../OtherData/zip2county_tx.dta')
+    county_names = read_stata_cached('../OtherData/fips2cntyname.dta')
+    ebt_dates = read_stata_cached('../OtherData/ebt_dates.dta')
     
     # Merge geographic info
     df['zipcode'] = df['panelist_zip_code']
@@ -125,11 +142,9 @@ def replicate_table4():
     # Chain stores  
     df_big = df[big_samp].copy()
     if len(df_big) > 0:
-        # Drop singletons
-        upc_counts = df_big.groupby('upc').size()
-        df_big = df_big[df_big['upc'].isin(upc_counts[upc_counts > 1].index)]
-        store_counts = df_big.groupby('storeretebt').size()
-        df_big = df_big[df_big['storeretebt'].isin(store_counts[store_counts > 1].index)]
+        # Drop singleton upc and store-EBT groups until none are left
+        df_big = df_big.dropna(subset=['upc', 'storeretebt'])
+        df_big = df_big[drop_singletons(fe_codes(df_big, ['upc', 'storeretebt']))]
         
         df_big = df_big.set_index(['storeretebt', 'purchase_ym_fe'])
         model = PanelOLS.from_formula('lfinalprice_perunit ~ after + EntityEffects + TimeEffects', 
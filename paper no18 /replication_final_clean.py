@@ -5,53 +5,66 @@ PAC and Charity Contributions Analysis
 
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import (build_design, demean, fe_codes, group_codes, prune_fixed_effects,
+                               read_stata_cached, recover_fixed_effects, sparse_ols)
+
 warnings.filterwarnings('ignore')
 
-def run_regression(df, dependent_var, independent_var, fe_vars):
-    """Run regression with multiple fixed effects using within-transformation"""
+def run_regression(df, dependent_var, independent_var, fe_vars, recover_effects=False):
+    """Run regression with multiple fixed effects using within-transformation
+
+    Returns the slope results and, with recover_effects=True, the recovered
+    fixed effects, one Series per FE indexed by its ID (else None). The
+    effects are only identified up to normalizations within connected
+    components, so compare them through identified contrasts, not levels.
+    """
     
     # Prepare data
     data = df[[dependent_var, independent_var] + fe_vars].dropna()
     
-    # Apply within-transformation for all fixed effects sequentially
-    y_demeaned = data[dependent_var].copy()
-    x_demeaned = data[independent_var].copy()
-    
-    for fe_var in fe_vars:
-        y_demeaned = data.groupby(fe_var)[dependent_var].transform(lambda x: x - x.mean())
-        x_demeaned = data.groupby(fe_var)[independent_var].transform(lambda x: x - x.mean())
-        # Update the data for next iteration
-        data = data.copy()
-        data[dependent_var] = y_demeaned
-        data[independent_var] = x_demeaned
+    # Drop singletons to a fixed point and count the parameters the FEs absorb
+    codes = fe_codes(data, fe_vars)
+    keep, absorbed = prune_fixed_effects(codes, cluster=data[fe_vars[0]])
+    data = data[keep]
+    codes = [group_codes(c[keep]) for c in codes]
     
-    # Run regression
-    X = sm.add_constant(x_demeaned.astype(float))
-    y = y_demeaned.astype(float)
+    # Within-transformation for all fixed effects jointly (alternating projections)
+    demeaned = demean(data[[dependent_var, independent_var]].to_numpy(dtype=float), codes)
+    within = pd.DataFrame(demeaned, index=data.index, columns=[dependent_var, independent_var])
     
-    model = sm.OLS(y, X)
-    results = model.fit(cov_type='cluster', cov_kwds={'groups': data[fe_vars[0]]})
+    # Run regression (the constant is absorbed by the fixed effects)
+    X = build_design(within, [independent_var], add_constant=False)
+    results = sparse_ols(X, within[dependent_var], cov_type='cluster', groups=data[fe_vars[0]],
+                         df_absorbed=absorbed)
     
-    return results
+    if not recover_effects:
+        return results, None
+
+    # Recover the FE levels given the slope
+    partial_resid = data[dependent_var] - results.params[independent_var] * data[independent_var]
+    return results, recover_fixed_effects(data, fe_vars, partial_resid)
 
 def main():
     """Main replication function"""
     
-    # Load data
-    df = pd.read_stata('PAC_charity.dta')
-    
     # Define fixed effects variables
     fe_vars = ['EIN_state_cd_id', 'state_cd_congress_id', 'EIN_congress_id']
     
+    # Load data (FE identifiers stored as compact int32/categorical columns)
+    df = read_stata_cached('PAC_charity.dta', id_columns=fe_vars)
+    
     # Run PAC regression (Table 3 Column 7)
-    pac_results = run_regression(df, 'lnPACamount', 'lnrep_issue_state_cd', fe_vars)
+    pac_results, _ = run_regression(df, 'lnPACamount', 'lnrep_issue_state_cd', fe_vars)
     pac_coeff = pac_results.params['lnrep_issue_state_cd']
     pac_se = pac_results.bse['lnrep_issue_state_cd']
     
     # Run Charity regression (Table 4 Column 7)
-    charity_results = run_regression(df, 'lncharamount', 'lnrep_issue_state_cd', fe_vars)
+    charity_results, _ = run_regression(df, 'lncharamount', 'lnrep_issue_state_cd', fe_vars)
     charity_coeff = charity_results.params['lnrep_issue_state_cd']
     charity_se = charity_results.bse['lnrep_issue_state_cd']
     
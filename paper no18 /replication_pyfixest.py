@@ -7,13 +7,20 @@ import pandas as pd
 import numpy as np
 import pyfixest as pf
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import read_stata_cached
+
 warnings.filterwarnings('ignore')
 
 def main():
     """Main replication function using pyfixest"""
     
-    # Load data
-    df = pd.read_stata('PAC_charity.dta')
+    # Load data (FE identifiers stored as compact int32/categorical columns)
+    df = read_stata_cached('PAC_charity.dta', id_columns=['EIN_state_cd_id', 'state_cd_congress_id',
+                                                         'EIN_congress_id'])
     
     # Run PAC regression (Table 3 Column 7)
     print("=" * 60)
@@ -1,10 +1,14 @@
 # === IMPORTS ===
 import pandas as pd
 import statsmodels.formula.api as smf
-import statsmodels.api as sm
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import StreamingOLS, batched_ols, build_design, iter_stata_chunks, read_stata_cached
 
 # === LOAD DATA ===
-df = pd.read_stata("AG_Corp_Prod_Database.dta")  # make sure it's in your project folder
+df = read_stata_cached("AG_Corp_Prod_Database.dta", id_columns=["id", "factory_id"])  # make sure it's in your project folder
 
 # === TABLE 3 CHECK: Pooled OLS ===
 df_check = df.dropna(subset=["logRevperWorker", "Form", "Industry", "Province", "YEAR"])
@@ -18,32 +22,30 @@ print(model_check.params["Form"], model_check.bse["Form"])
 
 
 # === STEP 1: Construct TFP as residuals ===
-df_tfp = df.dropna(subset=["logRev", "logWorkers", "logPower", "Industry", "Province", "YEAR", "id"]).copy()
-
-# Convert numeric columns to float and handle any non-numeric values
-df_tfp["logRev"] = pd.to_numeric(df_tfp["logRev"], errors='coerce')
-df_tfp["logWorkers"] = pd.to_numeric(df_tfp["logWorkers"], errors='coerce')
-df_tfp["logPower"] = pd.to_numeric(df_tfp["logPower"], errors='coerce')
-
-# Drop rows with NaN in numeric columns
-df_tfp = df_tfp.dropna(subset=["logRev", "logWorkers", "logPower"])
+# Cobb-Douglas stage fitted out of core: X'X and X'y are accumulated chunk by
+# chunk and the residuals streamed back out, so the dense dummy design is
+# never built for the full census
+TFP_COLUMNS = ["logRev", "logWorkers", "logPower", "Industry", "Province", "YEAR", "id"]
 
-industry_dummies = pd.get_dummies(df_tfp["Industry"], prefix="ind", drop_first=True)
-province_dummies = pd.get_dummies(df_tfp["Province"], prefix="prov", drop_first=True)
-year_dummies = pd.get_dummies(df_tfp["YEAR"], prefix="year", drop_first=True)
+def tfp_chunks():
+    """Stream the TFP estimation sample from the .dta (or its Parquet cache)"""
+    for chunk in iter_stata_chunks("AG_Corp_Prod_Database.dta", TFP_COLUMNS):
+        # Convert numeric columns to float and handle any non-numeric values
+        chunk = chunk.assign(**{col: pd.to_numeric(chunk[col], errors='coerce')
+                                for col in ["logRev", "logWorkers", "logPower"]})
+        yield chunk.dropna(subset=TFP_COLUMNS)
 
-X = pd.concat([df_tfp[["logWorkers", "logPower"]], industry_dummies, province_dummies, year_dummies], axis=1)
-X = sm.add_constant(X)
-y = df_tfp["logRev"]
+tfp_model = StreamingOLS("logRev", ["logWorkers", "logPower"],
+                         categorical={"Industry": "ind", "Province": "prov", "YEAR": "year"})
+tfp_model.collect_levels(tfp_chunks())
+tfp_model.fit(tfp_chunks())
 
-# Ensure all data is numeric
-X = X.astype(float)
-y = y.astype(float)
+tfp = pd.concat([chunk[["id"]].assign(TFP=resid)
+                 for chunk, resid in tfp_model.iter_residuals(tfp_chunks())], ignore_index=True)
+# The streamed ids are raw float64; give them the dtype normalize_dtypes chose for df.id
+tfp = tfp.astype({"id": df["id"].dtype})
 
-model = sm.OLS(y, X).fit()
-df_tfp["TFP"] = model.resid
-
-df = df.merge(df_tfp[["id", "TFP"]], on="id", how="left")
+df = df.merge(tfp, on="id", how="left")
 
 
 # === STEP 2: FIXED EFFECTS REGRESSIONS (Table 5) ===
@@ -59,12 +61,14 @@ for outcome in outcomes:
 df_fe = df_fe.dropna(subset=outcomes)
 
 print("\n=== Table 5 Fixed Effects Results ===")
+# Same design and sample for every outcome: factorize once and fit all three together
+X_fe = build_design(df_fe, ["Form"], categorical={"YEAR": "year"})
+fe_models = batched_ols(X_fe, df_fe[[o for o in outcomes if o in df_fe.columns]],
+                        cov_type="cluster", groups=df_fe["factory_id"])
+
 for outcome in outcomes:
     if outcome in df_fe.columns:
-        model = smf.ols(
-            formula=f"{outcome} ~ Form + C(YEAR)",
-            data=df_fe
-        ).fit(cov_type="cluster", cov_kwds={"groups": df_fe["factory_id"]})
+        model = fe_models[outcome]
 
         coef = model.params["Form"]
         se = model.bse["Form"]
@@ -77,4 +81,15 @@ for outcome in outcomes:
         print(f"  P-value:     {pval:.4f}")
         print(f"  95% CI:      [{ci[0]:.3f}, {ci[1]:.3f}]")
     else:
-        print(f"\nOutcome: {outcome} - Column not found in dataset") 
\ No newline at end of file
+        print(f"\nOutcome: {outcome} - Column not found in dataset")
+# Two-way clustering: by factory and by province x industry cell (the
+# notebook's RegIndGroup), combined by inclusion-exclusion in one sandwich
+df_2way = df_fe.dropna(subset=["Province", "Industry"]).copy()
+df_2way["RegIndGroup"] = df_2way["Province"].astype(str) + "_" + df_2way["Industry"].astype(str)
+X_2way = build_design(df_2way, ["Form"], categorical={"YEAR": "year"})
+models_2way = batched_ols(X_2way, df_2way[[o for o in outcomes if o in df_2way.columns]],
+                          cov_type="cluster", groups=df_2way[["factory_id", "RegIndGroup"]])
+
+print("\n=== Table 5, two-way clustered (factory, RegIndGroup) ===")
+for outcome, model in models_2way.items():
+    print(f"{outcome}: {model.params['Form']:.3f} ({model.bse['Form']:.3f}), p = {model.pvalues['Form']:.4f}")
@@ -1,24 +1,55 @@
-import pandas as pd
 import numpy as np
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import (BandwidthCache, DatasetPrefetcher, LocalLinearRD, RunningVariableIndex, batched_ols, bootstrap_ols,
+                               bootstrap_rd, build_design, placebo_cutoffs, read_stata_cached, sparse_ols)
+
+
+def prepare_rd_data(path, scale=100, polynomials=True):
+    """Load one panel's data and build the RD distance variables (EXACTLY like Stata)"""
+    df = read_stata_cached(path)
+    outside = df['broad'] == 0
+
+    # 1. Set negative values for distances outside BSP perimeter
+    df['temp'] = df['dist_netw'] / scale
+    df.loc[outside, 'temp'] = -df.loc[outside, 'dist_netw'] / scale
+
+    # 2. Change distance scale and create polynomial terms
+    df['dist_netw'] = df['dist_netw'] / scale
+    if polynomials:
+        df['dist_netw2'] = df['dist_netw'] ** 2
+        df['dist_netw3'] = df['dist_netw'] ** 3
+
+    # 3. Create dist_2 variable
+    df['dist_2'] = df['dist_netw']
+    df.loc[outside, 'dist_2'] = -df.loc[outside, 'dist_netw']
+    if polynomials:
+        df['dist_2_2'] = df['dist_2'] ** 2
+    return df
 
-# Load data
-df = pd.read_stata("Merged_1853_1864_data.dta").copy()
 
-# 1. Set negative values for distances outside BSP perimeter (EXACTLY like Stata)
-df['temp'] = df['dist_netw'] / 100
-df.loc[df['broad'] == 0, 'temp'] = -df.loc[df['broad'] == 0, 'dist_netw'] / 100
+# Load and prepare all three datasets on a background thread, in panel order,
+# so the 1894 and 1936 data are ready by the time panels C and D need them
+prefetcher = DatasetPrefetcher()
+prefetcher.submit('1853_1864', prepare_rd_data, "Merged_1853_1864_data.dta")
+prefetcher.submit('1894', prepare_rd_data, "Merged_1846_1894_data.dta")
+# 1936 distances are already in the scaled units and carry their own dist_netw2
+prefetcher.submit('1936', prepare_rd_data, "houses_1936_final.dta", scale=1, polynomials=False)
 
-# 2. Change distance scale (EXACTLY like Stata)
-df['dist_netw'] = df['dist_netw'] / 100
-df['dist_netw2'] = df['dist_netw'] ** 2
-df['dist_netw3'] = df['dist_netw'] ** 3
+# Load data
+df = prefetcher.get('1853_1864')
 
-# 3. Create dist_2 variable (EXACTLY like Stata)
-df['dist_2'] = df['dist_netw']
-df.loc[df['broad'] == 0, 'dist_2'] = -df.loc[df['broad'] == 0, 'dist_netw']
+# Rows sorted by distance once; bandwidth windows and outside-BSP means below are lookups
+index = RunningVariableIndex(df, 'dist_netw', 'broad')
 
 # 3. Calculate optimal bandwidth using Calonico et al. (2014) method
-from rdrobust import rdbwselect, rdrobust
+# The cache only skips repeated selections on identical samples (temp and
+# dist_2 are the same distances). Panels C and D select hopt on the column 1
+# sample and reuse it; panels A and B select hopt on rows with both outcomes,
+# so their rdrobust calls still select on their own samples
+bandwidths = BandwidthCache()
 
 outcomes = ['log_rentals_1853', 'log_rentals_1864']
 hopt = {}
@@ -28,15 +59,15 @@ df_bw = df.dropna(subset=['log_rentals_1853', 'log_rentals_1864', 'temp', 'block
 
 for var in outcomes:
     # Use rdbwselect to get optimal bandwidth (like Stata)
-    bw_result = rdbwselect(y=df_bw[var], x=df_bw['temp'], cluster=df_bw['block'])
-    hopt[var] = round(bw_result.bws.iloc[0, 0], 5)  # Get h (left) from mserd row
+    bws = bandwidths.select(y=df_bw[var], x=df_bw['temp'], cluster=df_bw['block'])
+    hopt[var] = round(bws.iloc[0, 0], 5)  # Get h (left) from mserd row
 
 # 4. Calculate means outside Broad Street area
-mean_out_rentals_53 = df.loc[(df['broad'] == 0) & (df['dist_netw'] < hopt['log_rentals_1853']), 'rentals_53'].mean()
-mean_out_rentals_64 = df.loc[(df['broad'] == 0) & (df['dist_netw'] < hopt['log_rentals_1864']), 'rentals_64'].mean()
+mean_out_rentals_53 = index.side_mean('rentals_53', 0, hopt['log_rentals_1853'], inclusive=False)
+mean_out_rentals_64 = index.side_mean('rentals_64', 0, hopt['log_rentals_1864'], inclusive=False)
 
-mean_out_rentals_53_all = df.loc[(df['broad'] == 0) & (df['dist_netw'] < 1), 'rentals_53'].mean()
-mean_out_rentals_64_all = df.loc[(df['broad'] == 0) & (df['dist_netw'] < 1), 'rentals_64'].mean()
+mean_out_rentals_53_all = index.side_mean('rentals_53', 0, 1, inclusive=False)
+mean_out_rentals_64_all = index.side_mean('rentals_64', 0, 1, inclusive=False)
 
 
 
@@ -44,7 +75,7 @@ mean_out_rentals_64_all = df.loc[(df['broad'] == 0) & (df['dist_netw'] < 1), 're
 df_reg = df.dropna(subset=['log_rentals_1853', 'dist_2', 'block'])
 
 # Use rdrobust for proper regression discontinuity estimation
-rd_result = rdrobust(y=df_reg['log_rentals_1853'], x=df_reg['dist_2'], cluster=df_reg['block'])
+rd_result = bandwidths.rdrobust(y=df_reg['log_rentals_1853'], x=df_reg['dist_2'], cluster=df_reg['block'])
 
 # Get results from rdrobust
 coef_dist2 = rd_result.coef.iloc[0, 0]  # Conventional coefficient
@@ -53,6 +84,22 @@ pval_dist2 = rd_result.pv.iloc[0, 0]    # Conventional p-value
 obs = rd_result.N_h[0] + rd_result.N_h[1]  # Total observations (left + right)
 bw = rd_result.bws.iloc[0, 0] * 100  # Bandwidth in meters
 
+# Bandwidth sensitivity: 200 bandwidths from half to twice the MSE-optimal one,
+# from one sorted pass (matches rdrobust with h given, b = h)
+h_mse = rd_result.bws.iloc[0, 0]
+rd_engine = LocalLinearRD(df_reg['log_rentals_1853'], df_reg['dist_2'], cluster=df_reg['block'])
+bw_sweep_53 = rd_engine.estimate(np.linspace(0.5, 2, 200) * h_mse)
+
+# The sweep must reproduce rdrobust at h = b = h_mse, clustered by block and
+# with HC1 errors, so changes to the prefix-sum updates cannot drift silently
+for engine, options in ((rd_engine, {'cluster': df_reg['block']}),
+                        (LocalLinearRD(df_reg['log_rentals_1853'], df_reg['dist_2']), {'vce': 'hc1'})):
+    check = engine.estimate([h_mse]).iloc[0]
+    reference = bandwidths.rdrobust(df_reg['log_rentals_1853'], df_reg['dist_2'], h=h_mse, **options)
+    assert np.isclose(check['coef'], reference.coef.iloc[0, 0], rtol=1e-8), (options, check['coef'])
+    assert np.isclose(check['se'], reference.se.iloc[0, 0], rtol=1e-8), (options, check['se'])
+    assert check['n_left'] + check['n_right'] == sum(reference.N_h), (options, reference.N_h)
+
 # =============================================================================
 # MAIN RESULTS SUMMARY - TABLE 3
 # =============================================================================
@@ -66,7 +113,7 @@ controls = ['dist_cent', 'dist_square', 'dist_fire', 'dist_thea', 'dist_police',
 df_reg2 = df.dropna(subset=['log_rentals_1853', 'dist_2', 'block'] + controls)
 
 # Use rdrobust with covariates
-rd_result2 = rdrobust(y=df_reg2['log_rentals_1853'], x=df_reg2['dist_2'], 
+rd_result2 = bandwidths.rdrobust(y=df_reg2['log_rentals_1853'], x=df_reg2['dist_2'], 
                      covs=df_reg2[controls], cluster=df_reg2['block'])
 
 coef_dist2_2 = rd_result2.coef.iloc[0, 0]
@@ -76,13 +123,13 @@ obs2 = rd_result2.N_h[0] + rd_result2.N_h[1]
 bw2 = rd_result2.bws.iloc[0, 0] * 100
 
 # Calculate mean for this bandwidth
-mean_out_llr2_53 = df.loc[(df['broad'] == 0) & (df['dist_netw'] <= rd_result2.bws.iloc[0, 0]), 'rentals_53'].mean()
+mean_out_llr2_53 = index.side_mean('rentals_53', 0, rd_result2.bws.iloc[0, 0])
 
 
 import statsmodels.api as sm
 
 # Filter by optimal bandwidth (use exact bandwidth from Stata results: 35.72 meters = 0.3572)
-df_reg3 = df[df['dist_netw'] <= 0.3572].dropna(subset=['log_rentals_1853', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls)
+df_reg3 = index.window(0.3572, columns=['log_rentals_1853', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls)
 
 # Create regression variables
 y3 = df_reg3['log_rentals_1853']
@@ -101,16 +148,15 @@ pval_broad_3 = model3.pvalues['broad']
 obs3 = model3.nobs
 
 
-df_reg4 = df[df['dist_netw'] <= 1].dropna(subset=['log_rentals_1853', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls)
+# Column 4 has the same design and sample filter in Panels A and B, so the
+# 1853 and 1864 outcomes are fitted together (each drops its own missing rows)
+df_reg4 = index.window(1, columns=['broad', 'dist_netw', 'dist_netw2', 'block'] + controls)
 
-y4 = df_reg4['log_rentals_1853']
-X4 = sm.add_constant(df_reg4[['broad', 'dist_netw', 'dist_netw2'] + controls])
-
-# Ensure all data is numeric
-X4 = X4.astype(float)
-y4 = y4.astype(float)
+Y4 = df_reg4[['log_rentals_1853', 'log_rentals_1864']].astype(float)
+X4 = build_design(df_reg4, ['broad', 'dist_netw', 'dist_netw2'] + controls)
 
-model4 = sm.OLS(y4, X4).fit(cov_type='cluster', cov_kwds={'groups': df_reg4['block']})
+models4 = batched_ols(X4, Y4, cov_type='cluster', groups=df_reg4['block'])
+model4 = models4['log_rentals_1853']
 
 coef_broad_4 = model4.params['broad']
 se_broad_4 = model4.bse['broad']
@@ -118,20 +164,13 @@ pval_broad_4 = model4.pvalues['broad']
 obs4 = model4.nobs
 
 
-df_reg5 = df[df['dist_netw'] < 1].dropna(subset=['log_rentals_1853', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls)
-
-# Create segment fixed effects
-seg_dummies = pd.get_dummies(df_reg5['seg_5'], prefix='seg', drop_first=True)
+df_reg5 = index.window(1, inclusive=False, columns=['log_rentals_1853', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls)
 
+# Segment fixed effects as a sparse dummy block
 y5 = df_reg5['log_rentals_1853']
-X5 = pd.concat([df_reg5[['broad', 'dist_netw', 'dist_netw2'] + controls], seg_dummies], axis=1)
-X5 = sm.add_constant(X5)
-
-# Ensure all data is numeric
-X5 = X5.astype(float)
-y5 = y5.astype(float)
+X5 = build_design(df_reg5, ['broad', 'dist_netw', 'dist_netw2'] + controls, categorical={'seg_5': 'seg'})
 
-model5 = sm.OLS(y5, X5).fit(cov_type='cluster', cov_kwds={'groups': df_reg5['block']})
+model5 = sparse_ols(X5, y5, cov_type='cluster', groups=df_reg5['block'])
 
 coef_broad_5 = model5.params['broad']
 se_broad_5 = model5.bse['broad']
@@ -146,7 +185,7 @@ obs5 = model5.nobs
 df_reg_b1 = df.dropna(subset=['log_rentals_1864', 'dist_2', 'block'])
 
 # Use rdrobust for proper regression discontinuity estimation
-rd_result_b1 = rdrobust(y=df_reg_b1['log_rentals_1864'], x=df_reg_b1['dist_2'], cluster=df_reg_b1['block'])
+rd_result_b1 = bandwidths.rdrobust(y=df_reg_b1['log_rentals_1864'], x=df_reg_b1['dist_2'], cluster=df_reg_b1['block'])
 
 # Get results from rdrobust
 coef_dist2_b1 = rd_result_b1.coef.iloc[0, 0]  # Conventional coefficient
@@ -156,13 +195,13 @@ obs_b1 = rd_result_b1.N_h[0] + rd_result_b1.N_h[1]  # Total observations (left +
 bw_b1 = rd_result_b1.bws.iloc[0, 0] * 100  # Bandwidth in meters
 
 # Calculate mean for 1864
-mean_out_rentals_64_b1 = df.loc[(df['broad'] == 0) & (df['dist_netw'] <= rd_result_b1.bws.iloc[0, 0]), 'rentals_64'].mean()
+mean_out_rentals_64_b1 = index.side_mean('rentals_64', 0, rd_result_b1.bws.iloc[0, 0])
 
 
 df_reg_b2 = df.dropna(subset=['log_rentals_1864', 'dist_2', 'block'] + controls)
 
 # Use rdrobust with covariates
-rd_result_b2 = rdrobust(y=df_reg_b2['log_rentals_1864'], x=df_reg_b2['dist_2'], 
+rd_result_b2 = bandwidths.rdrobust(y=df_reg_b2['log_rentals_1864'], x=df_reg_b2['dist_2'], 
                        covs=df_reg_b2[controls], cluster=df_reg_b2['block'])
 
 coef_dist2_b2 = rd_result_b2.coef.iloc[0, 0]
@@ -172,11 +211,11 @@ obs_b2 = rd_result_b2.N_h[0] + rd_result_b2.N_h[1]
 bw_b2 = rd_result_b2.bws.iloc[0, 0] * 100
 
 # Calculate mean for this bandwidth
-mean_out_llr2_64 = df.loc[(df['broad'] == 0) & (df['dist_netw'] <= rd_result_b2.bws.iloc[0, 0]), 'rentals_64'].mean()
+mean_out_llr2_64 = index.side_mean('rentals_64', 0, rd_result_b2.bws.iloc[0, 0])
 
 
 # Filter by optimal bandwidth (use exact bandwidth from Stata results: 28.04 meters = 0.2804)
-df_reg_b3 = df[df['dist_netw'] <= 0.2804].dropna(subset=['log_rentals_1864', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls)
+df_reg_b3 = index.window(0.2804, columns=['log_rentals_1864', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls)
 
 # Create regression variables
 y_b3 = df_reg_b3['log_rentals_1864']
@@ -195,16 +234,8 @@ pval_broad_b3 = model_b3.pvalues['broad']
 obs_b3 = model_b3.nobs
 
 
-df_reg_b4 = df[df['dist_netw'] <= 1].dropna(subset=['log_rentals_1864', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls)
-
-y_b4 = df_reg_b4['log_rentals_1864']
-X_b4 = sm.add_constant(df_reg_b4[['broad', 'dist_netw', 'dist_netw2'] + controls])
-
-# Ensure all data is numeric
-X_b4 = X_b4.astype(float)
-y_b4 = y_b4.astype(float)
-
-model_b4 = sm.OLS(y_b4, X_b4).fit(cov_type='cluster', cov_kwds={'groups': df_reg_b4['block']})
+# Fitted with Panel A's column 4
+model_b4 = models4['log_rentals_1864']
 
 coef_broad_b4 = model_b4.params['broad']
 se_broad_b4 = model_b4.bse['broad']
@@ -212,20 +243,13 @@ pval_broad_b4 = model_b4.pvalues['broad']
 obs_b4 = model_b4.nobs
 
 
-df_reg_b5 = df[df['dist_netw'] <= 1].dropna(subset=['log_rentals_1864', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls)
-
-# Create segment fixed effects
-seg_dummies_b5 = pd.get_dummies(df_reg_b5['seg_5'], prefix='seg', drop_first=True)
+df_reg_b5 = index.window(1, columns=['log_rentals_1864', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls)
 
+# Segment fixed effects as a sparse dummy block
 y_b5 = df_reg_b5['log_rentals_1864']
-X_b5 = pd.concat([df_reg_b5[['broad', 'dist_netw', 'dist_netw2'] + controls], seg_dummies_b5], axis=1)
-X_b5 = sm.add_constant(X_b5)
-
-# Ensure all data is numeric
-X_b5 = X_b5.astype(float)
-y_b5 = y_b5.astype(float)
+X_b5 = build_design(df_reg_b5, ['broad', 'dist_netw', 'dist_netw2'] + controls, categorical={'seg_5': 'seg'})
 
-model_b5 = sm.OLS(y_b5, X_b5).fit(cov_type='cluster', cov_kwds={'groups': df_reg_b5['block']})
+model_b5 = sparse_ols(X_b5, y_b5, cov_type='cluster', groups=df_reg_b5['block'])
 
 coef_broad_b5 = model_b5.params['broad']
 se_broad_b5 = model_b5.bse['broad']
@@ -238,38 +262,27 @@ obs_b5 = model_b5.nobs
 # =============================================================================
 
 
-# Load 1894 data
-df_1894 = pd.read_stata("Merged_1846_1894_data.dta").copy()
-
-# 1. Set negative values for distances outside BSP perimeter
-df_1894['temp'] = df_1894['dist_netw'] / 100
-df_1894.loc[df_1894['broad'] == 0, 'temp'] = -df_1894.loc[df_1894['broad'] == 0, 'dist_netw'] / 100
-
-# 2. Change distance scale and create polynomial terms
-df_1894['dist_netw'] = df_1894['dist_netw'] / 100
-df_1894['dist_netw2'] = df_1894['dist_netw'] ** 2
-df_1894['dist_netw3'] = df_1894['dist_netw'] ** 3
-df_1894['dist_2'] = df_1894['dist_netw']
-df_1894.loc[df_1894['broad'] == 0, 'dist_2'] = -df_1894.loc[df_1894['broad'] == 0, 'dist_netw']
-df_1894['dist_2_2'] = df_1894['dist_2'] ** 2
+# Load 1894 data (prefetched and prepared while panels A and B ran)
+df_1894 = prefetcher.get('1894')
+index_1894 = RunningVariableIndex(df_1894, 'dist_netw', 'broad')
 
 # 3. Calculate optimal bandwidth using Calonico et al. (2014) method
 outcomes_1894 = ['log_rentals_1894']
 hopt_1894 = {}
 df_bw_1894 = df_1894.dropna(subset=['log_rentals_1894', 'temp', 'block'])
 for var in outcomes_1894:
-    bw_result = rdbwselect(y=df_bw_1894[var], x=df_bw_1894['temp'], cluster=df_bw_1894['block'])
-    hopt_1894[var] = round(bw_result.bws.iloc[0, 0], 5)
+    bws = bandwidths.select(y=df_bw_1894[var], x=df_bw_1894['temp'], cluster=df_bw_1894['block'])
+    hopt_1894[var] = round(bws.iloc[0, 0], 5)
 
 
 # 4. Calculate means outside Broad Street area
-mean_out_rentals_94 = df_1894.loc[(df_1894['broad'] == 0) & (df_1894['dist_netw'] < hopt_1894['log_rentals_1894']), 'rentals_94'].mean()
-mean_out_rentals_94_all = df_1894.loc[(df_1894['broad'] == 0) & (df_1894['dist_netw'] < 1), 'rentals_94'].mean()
+mean_out_rentals_94 = index_1894.side_mean('rentals_94', 0, hopt_1894['log_rentals_1894'], inclusive=False)
+mean_out_rentals_94_all = index_1894.side_mean('rentals_94', 0, 1, inclusive=False)
 
 df_reg_c1 = df_1894.dropna(subset=['log_rentals_1894', 'dist_2', 'block'])
 
 # Use rdrobust for proper regression discontinuity estimation
-rd_result_c1 = rdrobust(y=df_reg_c1['log_rentals_1894'], x=df_reg_c1['dist_2'], cluster=df_reg_c1['block'])
+rd_result_c1 = bandwidths.rdrobust(y=df_reg_c1['log_rentals_1894'], x=df_reg_c1['dist_2'], cluster=df_reg_c1['block'])
 
 # Get results from rdrobust
 coef_dist2_c1 = rd_result_c1.coef.iloc[0, 0]
@@ -283,7 +296,7 @@ controls_1894 = ['dist_cent', 'dist_square', 'dist_bank', 'dist_vent', 'dist_pit
 df_reg_c2 = df_1894.dropna(subset=['log_rentals_1894', 'dist_2', 'block'] + controls_1894)
 
 # Use rdrobust with covariates
-rd_result_c2 = rdrobust(y=df_reg_c2['log_rentals_1894'], x=df_reg_c2['dist_2'], 
+rd_result_c2 = bandwidths.rdrobust(y=df_reg_c2['log_rentals_1894'], x=df_reg_c2['dist_2'], 
                        covs=df_reg_c2[controls_1894], cluster=df_reg_c2['block'])
 
 coef_dist2_c2 = rd_result_c2.coef.iloc[0, 0]
@@ -293,11 +306,11 @@ obs_c2 = rd_result_c2.N_h[0] + rd_result_c2.N_h[1]
 bw_c2 = rd_result_c2.bws.iloc[0, 0] * 100
 
 # Calculate mean for this bandwidth
-mean_out_llr2_94 = df_1894.loc[(df_1894['broad'] == 0) & (df_1894['dist_netw'] <= rd_result_c2.bws.iloc[0, 0]), 'rentals_94'].mean()
+mean_out_llr2_94 = index_1894.side_mean('rentals_94', 0, rd_result_c2.bws.iloc[0, 0])
 
 
 # Filter by optimal bandwidth
-df_reg_c3 = df_1894[df_1894['dist_netw'] < hopt_1894['log_rentals_1894']].dropna(subset=['log_rentals_1894', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1894)
+df_reg_c3 = index_1894.window(hopt_1894['log_rentals_1894'], inclusive=False, columns=['log_rentals_1894', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1894)
 
 # Create regression variables
 y_c3 = df_reg_c3['log_rentals_1894']
@@ -316,7 +329,7 @@ pval_broad_c3 = model_c3.pvalues['broad']
 obs_c3 = model_c3.nobs
 
 
-df_reg_c4 = df_1894[df_1894['dist_netw'] < 1].dropna(subset=['log_rentals_1894', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1894)
+df_reg_c4 = index_1894.window(1, inclusive=False, columns=['log_rentals_1894', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1894)
 
 y_c4 = df_reg_c4['log_rentals_1894']
 X_c4 = sm.add_constant(df_reg_c4[['broad', 'dist_netw', 'dist_netw2'] + controls_1894])
@@ -333,20 +346,13 @@ pval_broad_c4 = model_c4.pvalues['broad']
 obs_c4 = model_c4.nobs
 
 
-df_reg_c5 = df_1894[df_1894['dist_netw'] < 1].dropna(subset=['log_rentals_1894', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls_1894)
-
-# Create segment fixed effects
-seg_dummies_c5 = pd.get_dummies(df_reg_c5['seg_5'], prefix='seg', drop_first=True)
+df_reg_c5 = index_1894.window(1, inclusive=False, columns=['log_rentals_1894', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls_1894)
 
+# Segment fixed effects as a sparse dummy block
 y_c5 = df_reg_c5['log_rentals_1894']
-X_c5 = pd.concat([df_reg_c5[['broad', 'dist_netw', 'dist_netw2'] + controls_1894], seg_dummies_c5], axis=1)
-X_c5 = sm.add_constant(X_c5)
+X_c5 = build_design(df_reg_c5, ['broad', 'dist_netw', 'dist_netw2'] + controls_1894, categorical={'seg_5': 'seg'})
 
-# Ensure all data is numeric
-X_c5 = X_c5.astype(float)
-y_c5 = y_c5.astype(float)
-
-model_c5 = sm.OLS(y_c5, X_c5).fit(cov_type='cluster', cov_kwds={'groups': df_reg_c5['block']})
+model_c5 = sparse_ols(X_c5, y_c5, cov_type='cluster', groups=df_reg_c5['block'])
 
 coef_broad_c5 = model_c5.params['broad']
 se_broad_c5 = model_c5.bse['broad']
@@ -359,34 +365,28 @@ obs_c5 = model_c5.nobs
 # =============================================================================
 
 
-# Load 1936 data
-df_1936 = pd.read_stata("houses_1936_final.dta").copy()
-
-# 1. Set negative values for distances outside BSP perimeter
-df_1936['temp'] = df_1936['dist_netw']
-df_1936.loc[df_1936['broad'] == 0, 'temp'] = -df_1936.loc[df_1936['broad'] == 0, 'dist_netw']
-
-# 2. Create dist_2 variable
-df_1936['dist_2'] = df_1936['dist_netw']
-df_1936.loc[df_1936['broad'] == 0, 'dist_2'] = -df_1936.loc[df_1936['broad'] == 0, 'dist_netw']
+# Load 1936 data (prefetched and prepared in the background)
+df_1936 = prefetcher.get('1936')
+index_1936 = RunningVariableIndex(df_1936, 'dist_netw', 'broad')
+prefetcher.shutdown()
 
 # 3. Calculate optimal bandwidth using Calonico et al. (2014) method
 outcomes_1936 = ['lnrentals']
 hopt_1936 = {}
 df_bw_1936 = df_1936.dropna(subset=['lnrentals', 'temp', 'block'])
 for var in outcomes_1936:
-    bw_result = rdbwselect(y=df_bw_1936[var], x=df_bw_1936['temp'], cluster=df_bw_1936['block'])
-    hopt_1936[var] = round(bw_result.bws.iloc[0, 0], 4)
+    bws = bandwidths.select(y=df_bw_1936[var], x=df_bw_1936['temp'], cluster=df_bw_1936['block'])
+    hopt_1936[var] = round(bws.iloc[0, 0], 4)
 
 
 # 4. Calculate means outside Broad Street area
-mean_out_rentals_36 = df_1936.loc[(df_1936['broad'] == 0) & (df_1936['dist_netw'] < hopt_1936['lnrentals']), 'rentals'].mean()
-mean_out_rentals_36_all = df_1936.loc[(df_1936['broad'] == 0) & (df_1936['dist_netw'] < 1), 'rentals'].mean()
+mean_out_rentals_36 = index_1936.side_mean('rentals', 0, hopt_1936['lnrentals'], inclusive=False)
+mean_out_rentals_36_all = index_1936.side_mean('rentals', 0, 1, inclusive=False)
 
 df_reg_d1 = df_1936.dropna(subset=['lnrentals', 'dist_2', 'block'])
 
 # Use rdrobust for proper regression discontinuity estimation
-rd_result_d1 = rdrobust(y=df_reg_d1['lnrentals'], x=df_reg_d1['dist_2'], cluster=df_reg_d1['block'])
+rd_result_d1 = bandwidths.rdrobust(y=df_reg_d1['lnrentals'], x=df_reg_d1['dist_2'], cluster=df_reg_d1['block'])
 
 # Get results from rdrobust
 coef_dist2_d1 = rd_result_d1.coef.iloc[0, 0]
@@ -400,7 +400,7 @@ controls_1936 = ['dist_cent', 'dist_square', 'dist_thea', 'dist_pub', 'dist_chur
 df_reg_d2 = df_1936.dropna(subset=['lnrentals', 'dist_2', 'block'] + controls_1936)
 
 # Use rdrobust with covariates and fixed bandwidth h=0.373
-rd_result_d2 = rdrobust(y=df_reg_d2['lnrentals'], x=df_reg_d2['dist_2'], 
+rd_result_d2 = bandwidths.rdrobust(y=df_reg_d2['lnrentals'], x=df_reg_d2['dist_2'], 
                        covs=df_reg_d2[controls_1936], cluster=df_reg_d2['block'], h=0.373)
 
 coef_dist2_d2 = rd_result_d2.coef.iloc[0, 0]
@@ -410,12 +410,12 @@ obs_d2 = rd_result_d2.N_h[0] + rd_result_d2.N_h[1]
 bw_d2 = rd_result_d2.bws.iloc[0, 0] * 100
 
 # Calculate mean for this bandwidth
-mean_out_llr2_36 = df_1936.loc[(df_1936['broad'] == 0) & (df_1936['dist_netw'] <= rd_result_d2.bws.iloc[0, 0]), 'rentals'].mean()
+mean_out_llr2_36 = index_1936.side_mean('rentals', 0, rd_result_d2.bws.iloc[0, 0])
 
 
 controls_1936_full = ['dist_cent', 'dist_square', 'dist_thea', 'dist_school', 'dist_pub', 'dist_church', 'dist_bank', 'length', 'width']
 # Filter by optimal bandwidth
-df_reg_d3 = df_1936[df_1936['dist_netw'] < hopt_1936['lnrentals']].dropna(subset=['lnrentals', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1936_full)
+df_reg_d3 = index_1936.window(hopt_1936['lnrentals'], inclusive=False, columns=['lnrentals', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1936_full)
 
 # Create regression variables
 y_d3 = df_reg_d3['lnrentals']
@@ -434,7 +434,7 @@ pval_broad_d3 = model_d3.pvalues['broad']
 obs_d3 = model_d3.nobs
 
 
-df_reg_d4 = df_1936[df_1936['dist_netw'] < 1].dropna(subset=['lnrentals', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1936_full)
+df_reg_d4 = index_1936.window(1, inclusive=False, columns=['lnrentals', 'broad', 'dist_netw', 'dist_netw2', 'block'] + controls_1936_full)
 
 y_d4 = df_reg_d4['lnrentals']
 X_d4 = sm.add_constant(df_reg_d4[['broad', 'dist_netw', 'dist_netw2'] + controls_1936_full])
@@ -451,20 +451,13 @@ pval_broad_d4 = model_d4.pvalues['broad']
 obs_d4 = model_d4.nobs
 
 
-df_reg_d5 = df_1936[df_1936['dist_netw'] < 1].dropna(subset=['lnrentals', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls_1936_full)
-
-# Create segment fixed effects
-seg_dummies_d5 = pd.get_dummies(df_reg_d5['seg_5'], prefix='seg', drop_first=True)
+df_reg_d5 = index_1936.window(1, inclusive=False, columns=['lnrentals', 'broad', 'dist_netw', 'dist_netw2', 'block', 'seg_5'] + controls_1936_full)
 
+# Segment fixed effects as a sparse dummy block
 y_d5 = df_reg_d5['lnrentals']
-X_d5 = pd.concat([df_reg_d5[['broad', 'dist_netw', 'dist_netw2'] + controls_1936_full], seg_dummies_d5], axis=1)
-X_d5 = sm.add_constant(X_d5)
-
-# Ensure all data is numeric
-X_d5 = X_d5.astype(float)
-y_d5 = y_d5.astype(float)
+X_d5 = build_design(df_reg_d5, ['broad', 'dist_netw', 'dist_netw2'] + controls_1936_full, categorical={'seg_5': 'seg'})
 
-model_d5 = sm.OLS(y_d5, X_d5).fit(cov_type='cluster', cov_kwds={'groups': df_reg_d5['block']})
+model_d5 = sparse_ols(X_d5, y_d5, cov_type='cluster', groups=df_reg_d5['block'])
 
 coef_broad_d5 = model_d5.params['broad']
 se_broad_d5 = model_d5.bse['broad']
@@ -472,6 +465,50 @@ pval_broad_d5 = model_d5.pvalues['broad']
 obs_d5 = model_d5.nobs
 
 
+# =============================================================================
+# PLACEBO CUTOFFS - Panel A LLR (Col 1)
+# =============================================================================
+
+# Fake boundaries every 5 metres within 100 metres on each side, each estimated
+# like column 1 on its own side of the real boundary. Run after the prefetcher
+# has shut down, so no loader thread is alive when the pool forks.
+placebo_grid_53 = np.round(np.arange(-1, 1.0001, 0.05), 2)
+placebo_53, placebo_pval_53 = placebo_cutoffs(df_reg['log_rentals_1853'], df_reg['dist_2'], placebo_grid_53,
+                                              cluster=df_reg['block'])
+
+
+# =============================================================================
+# BLOCK BOOTSTRAP - Columns 1 and 3-5
+# =============================================================================
+
+BOOT_REPS = 2000
+
+
+def block_bootstrap_se(rd_sample, outcome, rd_fit, ols_columns, seed):
+    """Bootstrap SEs (blocks resampled) of the LLR estimate and of broad in the OLS columns
+
+    Column 1 keeps its MSE-optimal bandwidth fixed across draws.
+    """
+    ses = [bootstrap_rd(rd_sample[outcome], rd_sample['dist_2'], rd_fit.bws.iloc[0, 0], cluster=rd_sample['block'],
+                        reps=BOOT_REPS, seed=seed).bse['Conventional']]
+    for X, y, sample in ols_columns:
+        ses.append(bootstrap_ols(X, y, sample['block'], reps=BOOT_REPS, seed=seed).bse['broad'])
+    return ses
+
+
+boot_se = {
+    'A': block_bootstrap_se(df_reg, 'log_rentals_1853', rd_result,
+                            [(X3, y3, df_reg3), (X4, Y4['log_rentals_1853'], df_reg4), (X5, y5, df_reg5)], seed=1853),
+    'B': block_bootstrap_se(df_reg_b1, 'log_rentals_1864', rd_result_b1,
+                            [(X_b3, y_b3, df_reg_b3), (X4, Y4['log_rentals_1864'], df_reg4), (X_b5, y_b5, df_reg_b5)],
+                            seed=1864),
+    'C': block_bootstrap_se(df_reg_c1, 'log_rentals_1894', rd_result_c1,
+                            [(X_c3, y_c3, df_reg_c3), (X_c4, y_c4, df_reg_c4), (X_c5, y_c5, df_reg_c5)], seed=1894),
+    'D': block_bootstrap_se(df_reg_d1, 'lnrentals', rd_result_d1,
+                            [(X_d3, y_d3, df_reg_d3), (X_d4, y_d4, df_reg_d4), (X_d5, y_d5, df_reg_d5)], seed=1936),
+}
+
+
 # =============================================================================
 # FINAL SUMMARY - ALL PANELS
 # =============================================================================
@@ -513,6 +550,22 @@ print(f"  Wide BW (Col 4): {coef_broad_d4:.4f} ({se_broad_d4:.4f}) [p={pval_broa
 print(f"  Segment FE (Col 5): {coef_broad_d5:.4f} ({se_broad_d5:.4f}) [p={pval_broad_d5:.3f}] | N={obs_d5}")
 print()
 
+print(f"Block bootstrap standard errors ({BOOT_REPS} draws of block):")
+for panel, ses in boot_se.items():
+    print(f"  PANEL {panel}: LLR (Col 1) {ses[0]:.4f} | Col 3 {ses[1]:.4f} | Wide BW (Col 4) {ses[2]:.4f} | "
+          f"Segment FE (Col 5) {ses[3]:.4f}")
+print()
+
+placebo_rows = placebo_53[placebo_53['placebo']].dropna(subset=['coef'])
+print(f"Placebo cutoffs, Panel A LLR (Col 1): {len(placebo_rows)} fake boundaries within 100m, "
+      f"{(placebo_rows['pvalue'] < 0.05).sum()} significant at 5% | empirical p={placebo_pval_53:.3f}")
+print()
+
+print("Bandwidth sensitivity, Panel A LLR (Col 1), 0.5x to 2x the MSE-optimal bandwidth:")
+for row in bw_sweep_53.iloc[::40].itertuples():
+    print(f"  h={row.Index * 100:6.1f}m: {row.coef:.4f} ({row.se:.4f}) [p={row.pvalue:.3f}] | N={row.n_left + row.n_right}")
+print()
+
 """
 print("=" * 80)
 print("KEY FINDINGS:")
@@ -1,8 +1,13 @@
 import pandas as pd
 import numpy as np
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import read_stata_cached
 
 # Load data
-df = pd.read_stata("Merged_1853_1864_data.dta").copy()
+df = read_stata_cached("Merged_1853_1864_data.dta").copy()
 
 # 1. Set negative values for distances outside BSP perimeter (EXACTLY like Stata)
 df['temp'] = df['dist_netw'] / 100
@@ -239,7 +244,7 @@ obs_b5 = model_b5.nobs
 
 
 # Load 1894 data
-df_1894 = pd.read_stata("Merged_1846_1894_data.dta").copy()
+df_1894 = read_stata_cached("Merged_1846_1894_data.dta").copy()
 
 # 1. Set negative values for distances outside BSP perimeter
 df_1894['temp'] = df_1894['dist_netw'] / 100
@@ -360,7 +365,7 @@ obs_c5 = model_c5.nobs
 
 
 # Load 1936 data
-df_1936 = pd.read_stata("houses_1936_final.dta").copy()
+df_1936 = read_stata_cached("houses_1936_final.dta").copy()
 
 # 1. Set negative values for distances outside BSP perimeter
 df_1936['temp'] = df_1936['dist_netw']
@@ -1,26 +1,40 @@
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-from linearmodels import IV2SLS
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import batched_2sls, build_design, read_stata_filtered, sparse_ols, stata_columns
+
 warnings.filterwarnings('ignore')
 
 # =============================================================================
 # IV REGRESSION REPLICATION - Asher & Novosad (2020) - FIXED VERSION
 # =============================================================================
 
+PMGSY_FILE = "pmgsy_working_aer_mainsample.dta"
+
+# Only ~30 of the 1,070 variables are used below
+key_vars = ['r2012', 't', 'left', 'right', 'mainsample', 'vhg_dist_id', 'kernel_tri_mainband']
+family_indices = ['transport', 'occupation', 'firms', 'agriculture', 'consumption']
+outcome_vars = [f'{family}_index_andrsn{suffix}' for family in family_indices for suffix in ['', '_5k']]
+outcome_vars.append('unemp_5k')
+
+# Apply the main sample filter while reading when the file has it
+pmgsy_filters = [('mainsample', '==', 1)] if 'mainsample' in stata_columns(PMGSY_FILE) else None
+
 print("Loading PMGSY main sample data...")
-df = pd.read_stata("pmgsy_working_aer_mainsample.dta")
+df = read_stata_filtered(PMGSY_FILE, key_vars + outcome_vars, filters=pmgsy_filters,
+                         id_columns=['vhg_dist_id'])
 
 print(f"Data loaded: {len(df)} observations, {len(df.columns)} variables")
 
 # Check key variables
-key_vars = ['r2012', 't', 'left', 'right', 'mainsample', 'vhg_dist_id', 'kernel_tri_mainband']
 available_vars = [var for var in key_vars if var in df.columns]
 print(f"Available key variables: {available_vars}")
 
 # Check family indices
-family_indices = ['transport', 'occupation', 'firms', 'agriculture', 'consumption']
 available_indices = []
 for family in family_indices:
     main_var = f'{family}_index_andrsn'
@@ -40,10 +54,10 @@ print("\n" + "="*60)
 print("DATA PREPARATION")
 print("="*60)
 
-# Filter for main sample
-if 'mainsample' in df.columns:
-    df_main = df[df['mainsample'] == 1].copy()
-    print(f"Main sample size: {len(df_main)} (from {len(df)})")
+# Main sample filter was applied on load
+if pmgsy_filters:
+    df_main = df
+    print(f"Main sample size: {len(df_main)} (mainsample == 1 applied on load)")
 else:
     df_main = df.copy()
     print("No mainsample variable found, using full dataset")
@@ -74,25 +88,16 @@ if 'r2012' in df_main.columns and 't' in df_main.columns:
         X_vars.extend(['left', 'right'])
         print("Added left, right controls")
     
-    # Add district fixed effects if available
+    # Add district fixed effects if available (sparse dummy block, one nonzero per row)
+    fe_terms = {}
     if 'vhg_dist_id' in df_main.columns:
         print("Adding district fixed effects...")
-        # Convert district ID to string first to avoid issues
-        district_dummies = pd.get_dummies(df_main['vhg_dist_id'].astype(str), prefix='dist', drop_first=True)
-        X_fs = pd.concat([df_main[X_vars], district_dummies], axis=1)
-    else:
-        X_fs = df_main[X_vars]
-    
-    # Add constant
-    X_fs = sm.add_constant(X_fs)
-    
-    # Ensure all data is numeric
-    X_fs = X_fs.astype(float)
+        fe_terms = {'vhg_dist_id': 'dist'}
     
     # Remove missing values
-    valid_idx = ~(y_fs.isna() | X_fs.isna().any(axis=1))
+    valid_idx = ~(y_fs.isna() | df_main[X_vars + list(fe_terms)].isna().any(axis=1))
     y_fs_clean = y_fs[valid_idx]
-    X_fs_clean = X_fs[valid_idx]
+    X_fs_clean = build_design(df_main[valid_idx], X_vars, categorical=fe_terms)
     
     print(f"First stage observations: {len(y_fs_clean)}")
     
@@ -100,10 +105,10 @@ if 'r2012' in df_main.columns and 't' in df_main.columns:
     if 'kernel_tri_mainband' in df_main.columns:
         weights = df_main.loc[valid_idx, 'kernel_tri_mainband'].astype(float)
         print("Using kernel weights")
-        model_fs = sm.WLS(y_fs_clean, X_fs_clean, weights=weights).fit(cov_type='HC1')
+        model_fs = sparse_ols(X_fs_clean, y_fs_clean, weights=weights, cov_type='HC1')
     else:
         print("No weights available, using OLS")
-        model_fs = sm.OLS(y_fs_clean, X_fs_clean).fit(cov_type='HC1')
+        model_fs = sparse_ols(X_fs_clean, y_fs_clean, cov_type='HC1')
     
     print("\nFirst Stage Results:")
     if 't' in model_fs.params.index:
@@ -134,135 +139,63 @@ if 'left' in df_main.columns and 'right' in df_main.columns:
 else:
     exog_vars = []
 
-if 'vhg_dist_id' in df_main.columns:
-    district_dummies = pd.get_dummies(df_main['vhg_dist_id'].astype(str), prefix='dist', drop_first=True)
-    X_exog = pd.concat([df_main[exog_vars], district_dummies], axis=1)
-else:
-    X_exog = df_main[exog_vars]
+fe_terms = {'vhg_dist_id': 'dist'} if 'vhg_dist_id' in df_main.columns else {}
+
+# One sample for every outcome; each outcome then drops its own missing rows
+iv_sample = df_main[exog_vars + ['t', 'r2012'] + list(fe_terms)].notna().all(axis=1)
+df_iv = df_main[iv_sample]
+X_exog = build_design(df_iv, exog_vars, categorical=fe_terms)
+iv_weights = (df_iv['kernel_tri_mainband'].astype(float)
+              if 'kernel_tri_mainband' in df_iv.columns else None)
+
+# Log outcomes (add 1 to avoid log(0)), all fitted together: outcomes observed
+# on the same rows share one first-stage projection of r2012 on t
+iv_outcomes = [var for var in available_indices + ['unemp_5k'] if var in df_iv.columns]
+log_outcomes = pd.DataFrame({var: np.log(df_iv[var].astype(float) + 1) for var in iv_outcomes},
+                            index=df_iv.index)
+print(f"Running 2SLS for {len(iv_outcomes)} log outcomes...")
+iv_fits = batched_2sls(X_exog, df_iv['r2012'].astype(float), df_iv['t'].astype(float),
+                       log_outcomes, weights=iv_weights, cov_type='robust')
+
+
+def report_2sls(var):
+    """Print and store the r2012 coefficient for log(var)"""
+    if var not in df_main.columns:
+        print(f"Variable {var} not found in dataset")
+        return
+    fit = iv_fits.get(var)
+    if fit is None:
+        print(f"No valid observations for {var}")
+        return
+    coef = fit.params['r2012']
+    se = fit.std_errors['r2012']
+    pval = fit.pvalues['r2012']
+    first_stage_f = fit.first_stage_f['r2012']
+
+    results[f'log_{var}'] = {
+        'coefficient': coef,
+        'std_error': se,
+        'p_value': pval,
+        'observations': int(fit.nobs),
+        'first_stage_f': first_stage_f
+    }
+
+    print(f"Log({var}) on r2012:")
+    print(f"Coefficient: {coef:.4f}")
+    print(f"Standard Error: {se:.4f}")
+    print(f"P-value: {pval:.4f}")
+    print(f"Observations: {int(fit.nobs)}")
+    print(f"First-stage F: {first_stage_f:.2f}")
 
-X_exog = sm.add_constant(X_exog)
-X_exog = X_exog.astype(float)
 
-# Run 2SLS for each family index
 for family in family_indices:
     print(f"\n--- {family.upper()} INDEX ---")
-    
+
     # Main effect
-    main_var = f'{family}_index_andrsn'
-    if main_var in df_main.columns:
-        print(f"Running 2SLS for log({main_var})...")
-        
-        # Create log variable (add small constant to avoid log(0))
-        y_raw = df_main[main_var].astype(float)
-        y = np.log(y_raw + 1)  # log transformation
-        
-        # Remove missing values
-        valid_idx = ~(y.isna() | X_exog.isna().any(axis=1) | df_main['t'].isna())
-        
-        if valid_idx.sum() > 0:
-            y_clean = y[valid_idx]
-            X_clean = X_exog[valid_idx]
-            
-            # Add weights if available
-            if 'kernel_tri_mainband' in df_main.columns:
-                weights = df_main.loc[valid_idx, 'kernel_tri_mainband'].astype(float)
-            else:
-                weights = None
-            
-            try:
-                # Run 2SLS with proper syntax
-                # Endogenous: r2012, Instruments: t, Exogenous: X_clean
-                model_2sls = IV2SLS(
-                    dependent=y_clean,
-                    exog=X_clean,
-                    endog=df_main.loc[valid_idx, 'r2012'].astype(float),
-                    instruments=df_main.loc[valid_idx, 't'].astype(float),
-                    weights=weights
-                ).fit(cov_type='robust')
-                
-                # Get coefficient for r2012 (endogenous variable)
-                if 'r2012' in model_2sls.params.index:
-                    coef = model_2sls.params['r2012']
-                    se = model_2sls.std_errors['r2012']
-                    pval = model_2sls.pvalues['r2012']
-                    
-                    results[f'log_{main_var}'] = {
-                        'coefficient': coef,
-                        'std_error': se,
-                        'p_value': pval,
-                        'observations': len(y_clean)
-                    }
-                    
-                    print(f"Log({main_var}) on r2012:")
-                    print(f"Coefficient: {coef:.4f}")
-                    print(f"Standard Error: {se:.4f}")
-                    print(f"P-value: {pval:.4f}")
-                    print(f"Observations: {len(y_clean)}")
-                else:
-                    print(f"Warning: r2012 not found in results for {main_var}")
-                    
-            except Exception as e:
-                print(f"Error running 2SLS for {main_var}: {e}")
-        else:
-            print(f"No valid observations for {main_var}")
-    else:
-        print(f"Variable {main_var} not found in dataset")
-    
+    report_2sls(f'{family}_index_andrsn')
+
     # Spillover effect (5k)
-    spillover_var = f'{family}_index_andrsn_5k'
-    if spillover_var in df_main.columns:
-        print(f"Running 2SLS for log({spillover_var})...")
-        
-        # Create log variable
-        y_raw = df_main[spillover_var].astype(float)
-        y = np.log(y_raw + 1)  # log transformation
-        
-        valid_idx = ~(y.isna() | X_exog.isna().any(axis=1) | df_main['t'].isna())
-        
-        if valid_idx.sum() > 0:
-            y_clean = y[valid_idx]
-            X_clean = X_exog[valid_idx]
-            
-            if 'kernel_tri_mainband' in df_main.columns:
-                weights = df_main.loc[valid_idx, 'kernel_tri_mainband'].astype(float)
-            else:
-                weights = None
-            
-            try:
-                model_2sls = IV2SLS(
-                    dependent=y_clean,
-                    exog=X_clean,
-                    endog=df_main.loc[valid_idx, 'r2012'].astype(float),
-                    instruments=df_main.loc[valid_idx, 't'].astype(float),
-                    weights=weights
-                ).fit(cov_type='robust')
-                
-                if 'r2012' in model_2sls.params.index:
-                    coef = model_2sls.params['r2012']
-                    se = model_2sls.std_errors['r2012']
-                    pval = model_2sls.pvalues['r2012']
-                    
-                    results[f'log_{spillover_var}'] = {
-                        'coefficient': coef,
-                        'std_error': se,
-                        'p_value': pval,
-                        'observations': len(y_clean)
-                    }
-                    
-                    print(f"Log({spillover_var}) on r2012:")
-                    print(f"Coefficient: {coef:.4f}")
-                    print(f"Standard Error: {se:.4f}")
-                    print(f"P-value: {pval:.4f}")
-                    print(f"Observations: {len(y_clean)}")
-                else:
-                    print(f"Warning: r2012 not found in results for {spillover_var}")
-                    
-            except Exception as e:
-                print(f"Error running 2SLS for {spillover_var}: {e}")
-        else:
-            print(f"No valid observations for {spillover_var}")
-    else:
-        print(f"Variable {spillover_var} not found in dataset")
+    report_2sls(f'{family}_index_andrsn_5k')
 
 # =============================================================================
 # UNEMPLOYMENT REGRESSION (LOG LEVEL)
@@ -272,59 +205,7 @@ print("\n" + "="*60)
 print("UNEMPLOYMENT REGRESSION (LOG LEVEL)")
 print("="*60)
 
-if 'unemp_5k' in df_main.columns:
-    print("Running 2SLS for log(unemp_5k)...")
-    
-    # Create log variable
-    y_raw = df_main['unemp_5k'].astype(float)
-    y = np.log(y_raw + 1)  # log transformation
-    
-    valid_idx = ~(y.isna() | X_exog.isna().any(axis=1) | df_main['t'].isna())
-    
-    if valid_idx.sum() > 0:
-        y_clean = y[valid_idx]
-        X_clean = X_exog[valid_idx]
-        
-        if 'kernel_tri_mainband' in df_main.columns:
-            weights = df_main.loc[valid_idx, 'kernel_tri_mainband'].astype(float)
-        else:
-            weights = None
-        
-        try:
-            model_2sls = IV2SLS(
-                dependent=y_clean,
-                exog=X_clean,
-                endog=df_main.loc[valid_idx, 'r2012'].astype(float),
-                instruments=df_main.loc[valid_idx, 't'].astype(float),
-                weights=weights
-            ).fit(cov_type='robust')
-            
-            if 'r2012' in model_2sls.params.index:
-                coef = model_2sls.params['r2012']
-                se = model_2sls.std_errors['r2012']
-                pval = model_2sls.pvalues['r2012']
-                
-                results['log_unemp_5k'] = {
-                    'coefficient': coef,
-                    'std_error': se,
-                    'p_value': pval,
-                    'observations': len(y_clean)
-                }
-                
-                print(f"Log(unemp_5k) on r2012:")
-                print(f"Coefficient: {coef:.4f}")
-                print(f"Standard Error: {se:.4f}")
-                print(f"P-value: {pval:.4f}")
-                print(f"Observations: {len(y_clean)}")
-            else:
-                print("Warning: r2012 not found in unemployment results")
-                
-        except Exception as e:
-            print(f"Error running 2SLS for unemployment: {e}")
-    else:
-        print("No valid observations for unemployment")
-else:
-    print("Variable unemp_5k not found in dataset")
+report_2sls('unemp_5k')
 
 # =============================================================================
 # RESULTS SUMMARY
@@ -340,7 +221,7 @@ if results:
     
     print("\nIV Regression Results (Log Levels):")
     print("="*50)
-    print(summary_df)
+    print(summary_df.to_string())
     
     # Save results to CSV
     summary_df.to_csv('iv_regression_results_log.csv')
@@ -1,8 +1,12 @@
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-from linearmodels import IV2SLS
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import batched_2sls, build_design, read_stata_filtered, stata_columns
+
 warnings.filterwarnings('ignore')
 
 # =============================================================================
@@ -10,18 +14,10 @@ warnings.filterwarnings('ignore')
 # Based on paper_results_aer_final.do
 # =============================================================================
 
-# Load data
-df = pd.read_stata("pmgsy_working_aer_mainsample.dta")
-
-# Data preparation
-if 'mainsample' in df.columns:
-    df_main = df[df['mainsample'] == 1].copy()
-else:
-    df_main = df.copy()
+PMGSY_FILE = "pmgsy_working_aer_mainsample.dta"
 
 # Check for required variables
 required_vars = ['t', 'left', 'right', 'vhg_dist_id', 'ec13_emp_all_ln']
-available_vars = [var for var in required_vars if var in df_main.columns]
 
 # Check for control variables
 control_candidates = [
@@ -29,7 +25,6 @@ control_candidates = [
     'pc01_lit_share', 'primary_school', 'med_center', 'electric',
     'app_pr', 'app_mr', 'mcw', 'pc01_sc_share'
 ]
-available_controls = [var for var in control_candidates if var in df_main.columns]
 
 # Sector mapping
 sector_mapping = {
@@ -41,6 +36,16 @@ sector_mapping = {
     'Forestry': 'ec13_emp_act12_ln'
 }
 
+# Load only the variables used below, keeping main sample rows when the file has the flag
+load_vars = (required_vars + control_candidates + list(sector_mapping.values())
+             + ['r2012', 'kernel_tri_ik', 'kernel_tri_mainband'])
+pmgsy_filters = [('mainsample', '==', 1)] if 'mainsample' in stata_columns(PMGSY_FILE) else None
+df_main = read_stata_filtered(PMGSY_FILE, load_vars, filters=pmgsy_filters,
+                              id_columns=['vhg_dist_id'])
+
+available_vars = [var for var in required_vars if var in df_main.columns]
+available_controls = [var for var in control_candidates if var in df_main.columns]
+
 # Prepare regression variables
 if 'left' in df_main.columns and 'right' in df_main.columns:
     exog_vars = ['left', 'right']
@@ -51,63 +56,38 @@ else:
 if available_controls:
     exog_vars.extend(available_controls[:5])
 
-# Add district fixed effects
-if 'vhg_dist_id' in df_main.columns:
-    district_dummies = pd.get_dummies(df_main['vhg_dist_id'].astype(str), prefix='dist', drop_first=True)
-    X_exog = pd.concat([df_main[exog_vars], district_dummies], axis=1)
-else:
-    X_exog = df_main[exog_vars]
+# District fixed effects enter as a sparse dummy block
+fe_terms = {'vhg_dist_id': 'dist'} if 'vhg_dist_id' in df_main.columns else {}
 
-X_exog = sm.add_constant(X_exog)
-X_exog = X_exog.astype(float)
+iv_sample = df_main[exog_vars + ['t', 'r2012'] + list(fe_terms)].notna().all(axis=1)
+df_iv = df_main[iv_sample]
+X_exog = build_design(df_iv, exog_vars, categorical=fe_terms)
+
+# Add kernel weights if available
+if 'kernel_tri_ik' in df_iv.columns:
+    weights = df_iv['kernel_tri_ik'].astype(float)
+elif 'kernel_tri_mainband' in df_iv.columns:
+    weights = df_iv['kernel_tri_mainband'].astype(float)
+else:
+    weights = None
 
 # Store results
 results = {}
 
-# Run 2SLS for each sector
-for sector, log_var in sector_mapping.items():
-    if log_var in df_main.columns:
-        y = df_main[log_var].astype(float)
-        
-        # Remove missing values
-        valid_idx = ~(y.isna() | X_exog.isna().any(axis=1) | df_main['t'].isna())
-        
-        if valid_idx.sum() > 0:
-            y_clean = y[valid_idx]
-            X_clean = X_exog[valid_idx]
-            
-            # Add kernel weights if available
-            if 'kernel_tri_ik' in df_main.columns:
-                weights = df_main.loc[valid_idx, 'kernel_tri_ik'].astype(float)
-            elif 'kernel_tri_mainband' in df_main.columns:
-                weights = df_main.loc[valid_idx, 'kernel_tri_mainband'].astype(float)
-            else:
-                weights = None
-            
-            try:
-                # Run 2SLS
-                model_2sls = IV2SLS(
-                    dependent=y_clean,
-                    exog=X_clean,
-                    endog=df_main.loc[valid_idx, 'r2012'].astype(float),
-                    instruments=df_main.loc[valid_idx, 't'].astype(float),
-                    weights=weights
-                ).fit(cov_type='robust')
-                
-                # Get coefficient for r2012
-                if 'r2012' in model_2sls.params.index:
-                    coef = model_2sls.params['r2012']
-                    se = model_2sls.std_errors['r2012']
-                    obs = len(y_clean)
-                    
-                    results[sector] = {
-                        'coefficient': coef,
-                        'std_error': se,
-                        'observations': obs
-                    }
-                    
-            except Exception as e:
-                pass
+# Run 2SLS for every sector at once; sectors observed on the same rows share
+# the first stage
+sector_outcomes = {sector: log_var for sector, log_var in sector_mapping.items() if log_var in df_iv.columns}
+if sector_outcomes:
+    Y = df_iv[list(sector_outcomes.values())].astype(float)
+    fits = batched_2sls(X_exog, df_iv['r2012'].astype(float), df_iv['t'].astype(float), Y,
+                        weights=weights, cov_type='robust')
+    for sector, log_var in sector_outcomes.items():
+        if log_var in fits:
+            results[sector] = {
+                'coefficient': fits[log_var].params['r2012'],
+                'std_error': fits[log_var].std_errors['r2012'],
+                'observations': int(fits[log_var].nobs)
+            }
 
 # =============================================================================
 # FINAL RESULTS
@@ -3,35 +3,34 @@ Industrial Espionage and Productivity - Table 2 Final Clean Replication
 Authors: Albrecht Glitz and Erik Meyersson (2019)
 """
 
-import pandas as pd
-import numpy as np
-import statsmodels.api as sm
 import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from replication_utils import NestedOLS, build_design, read_stata_cached
+
 warnings.filterwarnings('ignore')
 
 def load_and_prepare_data():
     """Load and prepare the regression data"""
     try:
-        df = pd.read_stata('regdata_3_yes_.33_.06.dta')
+        df = read_stata_cached('regdata_3_yes_.33_.06.dta')
         return df
     except FileNotFoundError:
         print("Data file not found")
         return None
 
-def run_ols_regression(df, dependent_var, independent_vars, weights=None, cluster_var=None):
-    """Run OLS regression with clustering and weights"""
-    y = df[dependent_var].astype(float)
-    X = df[independent_vars].astype(float)
-    X = sm.add_constant(X)
-    
-    if weights is not None:
-        w = df[weights].astype(float)
-        model = sm.WLS(y, X, weights=w)
-    else:
-        model = sm.OLS(y, X)
-    
-    results = model.fit(cov_type='cluster', cov_kwds={'groups': df[cluster_var]})
-    return results
+def nested_ols_model(df, dependent_vars, independent_vars, fixed_effects=None, weights=None, cluster_var=None):
+    """Clustered, weighted OLS for nested specs over `independent_vars` on one sample
+
+    X'X is formed once with every regressor; each spec is then a fit() on
+    a prefix of column blocks that extends the shared factorization.
+    """
+    X = build_design(df, independent_vars, categorical=fixed_effects)
+    w = df[weights].astype(float) if weights is not None else None
+    return NestedOLS(X, df[dependent_vars].astype(float), weights=w,
+                     cov_type='cluster', groups=df[cluster_var])
 
 def main():
     """Main replication function"""
@@ -48,16 +47,22 @@ def main():
     espionage_var = 'inf_gva'
     patents_var = 'diff_patents_gva'
     
-    # Create fixed effects
-    year_dummies = pd.get_dummies(df_filtered['year'], prefix='yd', drop_first=True)
-    branch_dummies = pd.get_dummies(df_filtered['branch'], prefix='br', drop_first=True)
-    df_filtered = pd.concat([df_filtered, year_dummies, branch_dummies], axis=1)
-    fe_vars = [col for col in df_filtered.columns if col.startswith(('yd_', 'br_'))]
+    # Year and branch fixed effects (sparse dummy blocks)
+    fe_terms = {'year': 'yd', 'branch': 'br'}
     
     # Loop over outcomes
     outcomes = ['difflnTFP', 'diffln_gvapc']
+    dependent_vars = ['c3difflnTFP', 'c3diffln_gvapc']
     results_summary = {}
     
+    # Columns 1 -> 2 -> 3 add the patent gap and then the lagged gap to the same
+    # FE design and sample, so all of them extend one factorization
+    model = nested_ols_model(df_filtered, dependent_vars, [espionage_var, patents_var] + outcomes, fe_terms,
+                             weights='weight_workers', cluster_var='branch')
+    base = [col for col in model.design.columns if col not in [patents_var] + outcomes]
+    results_col1 = model.fit(base)
+    results_col2 = model.fit(base, [patents_var])
+    
     for y in outcomes:
         if y == "difflnTFP":
             ylabel = "TFP"
@@ -69,9 +74,7 @@ def main():
         results_summary[y] = {}
         
         # Column 1: Unconditional
-        X_vars_1 = [espionage_var] + fe_vars
-        results_1 = run_ols_regression(df_filtered, dependent_var, X_vars_1, 
-                                     weights='weight_workers', cluster_var='branch')
+        results_1 = results_col1[dependent_var]
         
         results_summary[y]['col1'] = {
             'espionage_coef': results_1.params[espionage_var],
@@ -81,9 +84,7 @@ def main():
         }
         
         # Column 2: With Patent Gap
-        X_vars_2 = [espionage_var, patents_var] + fe_vars
-        results_2 = run_ols_regression(df_filtered, dependent_var, X_vars_2, 
-                                     weights='weight_workers', cluster_var='branch')
+        results_2 = results_col2[dependent_var]
         
         results_summary[y]['col2'] = {
             'espionage_coef': results_2.params[espionage_var],
@@ -95,9 +96,7 @@ def main():
         }
         
         # Column 3: With Patent Gap and Lagged Gap
-        X_vars_3 = [espionage_var, patents_var, y] + fe_vars
-        results_3 = run_ols_regression(df_filtered, dependent_var, X_vars_3, 
-                                     weights='weight_workers', cluster_var='branch')
+        results_3 = model.fit(base, [patents_var], [y], outcomes=[dependent_var])[dependent_var]
         
         results_summary[y]['col3'] = {
             'espionage_coef': results_3.params[espionage_var],
@@ -0,0 +1,69 @@
+"""
+Shared helpers for the replication scripts
+
+The paper folders contain spaces in their names, so the scripts add the
+repository root to sys.path before importing from this package.
+"""
+
+from .bootstrap import BootstrapResults, bootstrap_ols, bootstrap_rd, cluster_weights
+from .design import Design, build_design, dummy_block
+from .dtypes import normalize_dtypes
+from .fixed_effects import (WithinOLS, absorbed_parameters, demean, drop_singletons, fe_codes,
+                            fe_components, prune_fixed_effects, recover_fixed_effects)
+from .group_stats import GroupIndex, group_codes
+from .iv import IVResults, batched_2sls
+from .ols import NestedOLS, SparseOLSResults, StreamingOLS, batched_ols, solve_normal_equations, sparse_ols
+from .prefetch import DatasetPrefetcher
+from .rd import BandwidthCache, LocalLinearRD, RunningVariableIndex, placebo_cutoffs
+from .covariance import Clusters, intersect_codes, sandwich
+from .shared_data import SharedFrame, attach, init_worker, process_pool, worker_data
+from .stata_io import (iter_stata_chunks, read_stata_cached, read_stata_filtered,
+                       stata_column_stats, stata_columns, stata_metadata)
+
+__all__ = [
+    'BandwidthCache',
+    'BootstrapResults',
+    'Clusters',
+    'DatasetPrefetcher',
+    'Design',
+    'GroupIndex',
+    'IVResults',
+    'LocalLinearRD',
+    'NestedOLS',
+    'RunningVariableIndex',
+    'SharedFrame',
+    'SparseOLSResults',
+    'StreamingOLS',
+    'WithinOLS',
+    'absorbed_parameters',
+    'attach',
+    'batched_2sls',
+    'batched_ols',
+    'bootstrap_ols',
+    'bootstrap_rd',
+    'build_design',
+    'cluster_weights',
+    'demean',
+    'drop_singletons',
+    'dummy_block',
+    'fe_codes',
+    'fe_components',
+    'group_codes',
+    'init_worker',
+    'intersect_codes',
+    'iter_stata_chunks',
+    'normalize_dtypes',
+    'placebo_cutoffs',
+    'process_pool',
+    'prune_fixed_effects',
+    'read_stata_cached',
+    'read_stata_filtered',
+    'recover_fixed_effects',
+    'sandwich',
+    'solve_normal_equations',
+    'sparse_ols',
+    'stata_column_stats',
+    'stata_columns',
+    'stata_metadata',
+    'worker_data',
+]
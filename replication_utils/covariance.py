@@ -0,0 +1,149 @@
+"""
+Heteroskedasticity- and cluster-robust sandwich covariances
+Scores are summed within clusters by bincount-style reductions, so each
+meat costs O(n k); multiway clustering by inclusion-exclusion
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .group_stats import GroupIndex, group_codes
+
+
+def _as_columns(groups):
+    """A list of cluster columns from one array, a DataFrame or a list of arrays"""
+    if isinstance(groups, pd.DataFrame):
+        return [groups[col] for col in groups.columns]
+    if isinstance(groups, (list, tuple)):
+        return list(groups)
+    if isinstance(groups, np.ndarray) and groups.ndim == 2:
+        return list(groups.T)
+    return [groups]
+
+
+def intersect_codes(codes):
+    """Integer codes for the intersection of several integer-coded groupings"""
+    combined = np.zeros(len(codes[0]), dtype=np.int64)
+    for c in codes:
+        combined = pd.factorize(combined * (int(c.max()) + 1) + c)[0]
+    return combined.astype(np.intp)
+
+
+class _Term:
+    """One grouping in the inclusion-exclusion sum"""
+
+    def __init__(self, codes, sign):
+        self.groups = GroupIndex(codes)
+        self.sign = sign
+        self._incidence = None
+
+    @property
+    def ngroups(self):
+        return self.groups.ngroups
+
+    def score_sums(self, scores):
+        """(G, k) sums of the rows of `scores` within each group"""
+        if sp.issparse(scores):
+            if self._incidence is None:
+                n = len(self.groups)
+                self._incidence = sp.csr_matrix((np.ones(n), (self.groups.codes, np.arange(n))),
+                                                shape=(self.ngroups, n))
+            return self._incidence @ scores
+        return self.groups.sum(scores)
+
+
+class Clusters:
+    """One or more clustering variables, coded once and reused across fits
+
+    With several variables the meat is the inclusion-exclusion sum over
+    every non-empty subset of them, clustered on the subset's intersection
+    (Cameron, Gelbach and Miller 2011): + A + B - A&B for two-way,
+    + A + B + C - A&B - A&C - B&C + A&B&C for three-way.
+    """
+
+    def __init__(self, groups):
+        columns = _as_columns(groups)
+        if not columns:
+            raise ValueError("Clusters needs at least one clustering variable")
+        codes = [group_codes(col) for col in columns]
+        if len({len(c) for c in codes}) > 1:
+            raise ValueError("Clustering variables have different lengths")
+        self.nobs = len(codes[0])
+        self.ngroups = [int(c.max()) + 1 if len(c) else 0 for c in codes]
+        self.terms = []
+        for size in range(1, len(codes) + 1):
+            for subset in combinations(codes, size):
+                term_codes = subset[0] if size == 1 else intersect_codes(subset)
+                self.terms.append(_Term(term_codes, (-1) ** (size + 1)))
+
+    def __len__(self):
+        return len(self.ngroups)
+
+    def meat(self, scores, cluster_df='min'):
+        """Sum of outer products of within-cluster score sums
+
+        `cluster_df='min'` applies G/(G-1) with G the smallest number of
+        clusters to the whole meat, as Stata's reghdfe and ivreg2 do;
+        'conventional' applies each term's own G/(G-1) (Stata's cgmreg).
+        With one variable the two are the same.
+        """
+        if cluster_df not in ('min', 'conventional'):
+            raise ValueError(f"Unknown cluster_df {cluster_df!r}")
+        meat = 0
+        for term in self.terms:
+            sums = term.score_sums(scores)
+            outer = sums.T @ sums
+            outer = outer.toarray() if sp.issparse(outer) else np.asarray(outer)
+            if cluster_df == 'conventional':
+                outer = outer * _group_factor(term.ngroups)
+            meat = meat + term.sign * outer
+        if cluster_df == 'min':
+            meat = meat * _group_factor(min(self.ngroups))
+        return meat
+
+
+def _group_factor(ngroups):
+    if ngroups < 2:
+        raise ValueError("Clustered covariance needs at least two clusters")
+    return ngroups / (ngroups - 1)
+
+
+def _fix_negative_variances(cov):
+    """Zero out negative eigenvalues if a multiway variance came out negative"""
+    if np.diag(cov).min() >= 0:
+        return cov
+    values, vectors = np.linalg.eigh(cov)
+    return (vectors * np.clip(values, 0, None)) @ vectors.T
+
+
+def sandwich(bread, scores, clusters=None, df_resid=None, cluster_df='min'):
+    """bread @ meat @ bread for (n, k) scores x_i e_i, dense or sparse
+
+    `bread` is (X'X)^-1 for OLS, or its 2SLS analogue. Without `clusters`
+    the meat is sum_i s_i s_i' (HC0), scaled by n / df_resid (Stata's
+    `robust`, HC1) when `df_resid` is given. `clusters` is a Clusters or
+    anything it accepts (one column, a DataFrame or list of columns); the
+    meat is then built from within-cluster score sums with G/(G-1)
+    corrections, times (n - 1) / df_resid when `df_resid` is given, as in
+    Stata's vce(cluster). A multiway covariance with a negative variance
+    has its negative eigenvalues set to zero (Cameron, Gelbach and Miller).
+    """
+    n = scores.shape[0]
+    if clusters is None:
+        meat = scores.T @ scores
+        meat = meat.toarray() if sp.issparse(meat) else np.asarray(meat)
+        correction = 1 if df_resid is None else n / df_resid
+    else:
+        if not isinstance(clusters, Clusters):
+            clusters = Clusters(clusters)
+        if clusters.nobs != n:
+            raise ValueError("Clusters and scores have different numbers of rows")
+        meat = clusters.meat(scores, cluster_df)
+        correction = 1 if df_resid is None else (n - 1) / df_resid
+    cov = bread @ meat @ bread * correction
+    if clusters is not None and len(clusters) > 1:
+        cov = _fix_negative_variances(cov)
+    return cov
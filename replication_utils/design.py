@@ -0,0 +1,73 @@
+"""
+Sparse regression designs
+Categorical terms become scipy.sparse CSR dummy blocks instead of dense
+pd.get_dummies frames, so memory scales with nnz rather than rows x levels
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def dummy_block(values, prefix, levels=None, drop_first=True):
+    """CSR dummy matrix and column names for one categorical column
+
+    Matches pd.get_dummies(values, prefix=prefix, drop_first=drop_first):
+    levels are sorted (or the categorical's categories) and names are
+    f'{prefix}_{level}'. Missing values, or values outside `levels`, raise
+    instead of silently joining the base level; drop those rows first.
+    """
+    cat = pd.Categorical(values, categories=levels)
+    levels = list(cat.categories)
+    offset = 1 if drop_first else 0
+    codes = np.asarray(cat.codes)
+    if (codes < 0).any():
+        name = getattr(values, 'name', None) or prefix
+        raise ValueError(f"{name} has missing values or levels outside `levels`; drop those rows first")
+    rows = np.flatnonzero(codes >= offset)
+    matrix = sp.csr_matrix(
+        (np.ones(len(rows)), (rows, codes[rows] - offset)),
+        shape=(len(codes), max(len(levels) - offset, 0)),
+    )
+    return matrix, [f'{prefix}_{level}' for level in levels[offset:]]
+
+
+class Design:
+    """Sparse design matrix with named columns"""
+
+    def __init__(self, matrix, columns):
+        self.matrix = sp.csr_matrix(matrix)
+        self.columns = list(columns)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def to_frame(self, index=None):
+        """Dense DataFrame (only for small designs or libraries that need one)"""
+        return pd.DataFrame(self.matrix.toarray(), columns=self.columns, index=index)
+
+
+def build_design(df, regressors=(), categorical=None, levels=None, add_constant=True):
+    """Constant, continuous regressors and sparse dummy blocks, horizontally stacked
+
+    `categorical` maps each column to its dummy prefix (first level dropped,
+    as in pd.get_dummies(..., drop_first=True)); `levels` optionally fixes
+    the level set per column, e.g. when a design is built chunk by chunk.
+    Column order matches sm.add_constant(pd.concat([df[regressors], dummies...])).
+    """
+    categorical = dict(categorical or {})
+    levels = dict(levels or {})
+    blocks, columns = [], []
+    if add_constant:
+        blocks.append(sp.csr_matrix(np.ones((len(df), 1))))
+        columns.append('const')
+    if len(regressors):
+        blocks.append(sp.csr_matrix(df[list(regressors)].to_numpy(dtype=float)))
+        columns += list(regressors)
+    for col, prefix in categorical.items():
+        block, names = dummy_block(df[col], prefix, levels=levels.get(col))
+        blocks.append(block)
+        columns += names
+    matrix = sp.hstack(blocks, format='csr') if blocks else sp.csr_matrix((len(df), 0))
+    return Design(matrix, columns)
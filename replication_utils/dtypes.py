@@ -0,0 +1,67 @@
+"""
+Memory-compact dtypes for loaded datasets
+ID columns become int32 or categoricals, measures optionally float32
+"""
+
+import numpy as np
+import pandas as pd
+
+_INT32 = np.iinfo(np.int32)
+# Largest integer range float32 stores exactly
+_FLOAT32_EXACT = 2 ** 24
+
+
+def _compact_id(s):
+    """Smallest lossless representation of an identifier column"""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    if pd.api.types.is_bool_dtype(s) or not pd.api.types.is_numeric_dtype(s):
+        return s.astype('category')
+
+    values = s.to_numpy(dtype=float, na_value=np.nan)
+    present = values[~np.isnan(values)]
+    integral = present.size == 0 or bool(np.all(np.mod(present, 1) == 0))
+    if integral and present.size == values.size and (
+            present.size == 0 or (present.min() >= _INT32.min and present.max() <= _INT32.max)):
+        # Stata byte and int columns are already narrower than int32
+        if pd.api.types.is_integer_dtype(s) and s.dtype.itemsize <= 4:
+            return s
+        return s.astype(np.int32)
+    if integral and (present.size == 0 or np.abs(present).max() < _FLOAT32_EXACT):
+        # Keep NaN so dropna(subset=[id]) still works downstream
+        return s.astype(np.float32)
+    return s.astype('category')
+
+
+def normalize_dtypes(df, id_columns=(), float32=False, name=None, verbose=True):
+    """Downcast ID columns and optionally store measures as float32
+
+    Integral IDs without missing values become int32 unless already
+    narrower, integral IDs with missing values become float32, and string
+    or non-integral IDs become categoricals. Values are kept, so cluster
+    groups are unaffected; give the other side of a merge the same dtype.
+    With float32=True all remaining float64 columns are stored as float32.
+
+    The before/after memory is stored in df.attrs['memory_report'] and
+    printed unless verbose=False.
+    """
+    id_columns = [c for c in id_columns if c in df.columns]
+    before = int(df.memory_usage(deep=True).sum())
+
+    converted = {c: _compact_id(df[c]) for c in id_columns}
+    if float32:
+        for c in df.columns:
+            if c not in converted and df[c].dtype == np.float64:
+                converted[c] = df[c].astype(np.float32)
+    if converted:
+        df = df.assign(**converted)
+
+    after = int(df.memory_usage(deep=True).sum())
+    report = {'before_mb': before / 1e6, 'after_mb': after / 1e6,
+              'saved_mb': (before - after) / 1e6}
+    df.attrs['memory_report'] = report
+    if verbose:
+        label = name or 'dataset'
+        print(f"{label}: {report['before_mb']:.1f} MB -> {report['after_mb']:.1f} MB "
+              f"({report['saved_mb']:.1f} MB saved)")
+    return df
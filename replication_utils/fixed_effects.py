@@ -0,0 +1,327 @@
+"""
+High-dimensional fixed-effect absorption
+Method of alternating projections on integer-coded FE arrays, accelerated
+by conjugate gradient or Irons-Tuck, so no dummy matrix is ever built
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import lsmr
+
+from .design import Design
+from .group_stats import GroupIndex, group_codes
+from .ols import NestedOLS
+
+
+def fe_codes(df, fe_vars):
+    """Integer codes 0..G-1 for each fixed-effect column"""
+    codes = []
+    for var in fe_vars:
+        try:
+            codes.append(group_codes(df[var]))
+        except ValueError:
+            raise ValueError(f"{var} has missing values; drop them before absorbing") from None
+    return codes
+
+
+def drop_singletons(codes):
+    """Keep-mask after iteratively dropping rows alone in any FE group
+
+    Dropping one singleton can leave another group with a single row, so
+    the pass repeats until no FE has a singleton left.
+    """
+    codes = [np.asarray(c) for c in codes]
+    keep = np.ones(len(codes[0]) if codes else 0, dtype=bool)
+    changed = True
+    while changed:
+        changed = False
+        for c in codes:
+            counts = np.bincount(c[keep], minlength=int(c.max()) + 1 if len(c) else 0)
+            singleton = keep & (counts[c] == 1)
+            if singleton.any():
+                keep &= ~singleton
+                changed = True
+    return keep
+
+
+def fe_components(codes_a, codes_b):
+    """Connected components of the bipartite graph linking two FEs' levels
+
+    Each row is an edge between its level of the first FE and its level of
+    the second. Returns (component label per row, number of components).
+    """
+    a, b = np.asarray(codes_a), np.asarray(codes_b)
+    n_a = int(a.max()) + 1 if len(a) else 0
+    n_b = int(b.max()) + 1 if len(b) else 0
+    graph = sp.csr_matrix((np.ones(len(a), dtype=np.int8), (a, n_a + b)), shape=(n_a + n_b,) * 2)
+    n_components, labels = connected_components(graph, directed=False)
+    # Levels that never appear would count as their own components
+    used = np.zeros(n_a + n_b, dtype=bool)
+    used[a] = True
+    used[n_a + b] = True
+    relabel = np.full(n_components, -1)
+    present = np.unique(labels[used])
+    relabel[present] = np.arange(len(present))
+    return relabel[labels[a]], len(present)
+
+
+def _nested(codes, cluster):
+    """Whether every level of an FE falls inside a single cluster"""
+    order = np.lexsort((cluster, codes))
+    c, g = codes[order], cluster[order]
+    same_level = c[1:] == c[:-1]
+    return not np.any(same_level & (g[1:] != g[:-1]))
+
+
+def absorbed_parameters(codes, cluster=None):
+    """Degrees of freedom used up by the fixed effects
+
+    The first FE counts all its levels and the second its levels minus the
+    connected components it forms with the first (exact for two FEs); each
+    further FE conservatively loses one redundant level. FEs nested within
+    `cluster` count nothing, as in reghdfe.
+    """
+    codes = [np.asarray(c) for c in codes]
+    if not codes:
+        return 0
+    absorbed = [len(np.unique(c)) for c in codes]
+    if len(codes) > 1:
+        absorbed[1] -= fe_components(codes[0], codes[1])[1]
+    for k in range(2, len(codes)):
+        absorbed[k] -= 1
+    if cluster is not None:
+        cluster = group_codes(cluster)
+        absorbed = [0 if _nested(c, cluster) else a for c, a in zip(codes, absorbed)]
+    return int(sum(absorbed))
+
+
+def prune_fixed_effects(codes, cluster=None):
+    """Drop singletons to a fixed point and count the absorbed parameters
+
+    Returns (keep mask, absorbed parameters on the kept rows).
+    """
+    keep = drop_singletons(codes)
+    kept = [group_codes(np.asarray(c)[keep]) for c in codes]
+    kept_cluster = None if cluster is None else np.asarray(cluster)[keep]
+    return keep, absorbed_parameters(kept, kept_cluster)
+
+
+class _Projector:
+    """One sweep of group-mean removal over every fixed effect"""
+
+    def __init__(self, codes, weights=None):
+        self.groups = [GroupIndex(c) for c in codes]
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.totals = [g.count(self.weights) for g in self.groups]
+
+    def _remove_means(self, x, i):
+        group = self.groups[i]
+        x -= group.broadcast(group.mean(x, self.weights, self.totals[i]))
+
+    def sweep(self, x):
+        """x minus its group means for each FE in turn (x is one column)"""
+        x = x.copy()
+        for i in range(len(self.groups)):
+            self._remove_means(x, i)
+        return x
+
+    def symmetric_sweep(self, x):
+        """Forward then backward sweep; a self-adjoint operator, as CG needs"""
+        x = x.copy()
+        order = list(range(len(self.groups)))
+        for i in order + order[-2::-1]:
+            self._remove_means(x, i)
+        return x
+
+    def dot(self, a, b):
+        return a @ b if self.weights is None else (a * self.weights) @ b
+
+    def max_group_mean(self, x):
+        """Largest absolute (weighted) group mean left in x over every FE; 0 once fully demeaned"""
+        return max(np.max(np.abs(group.mean(x, self.weights, totals)), initial=0.0)
+                   for group, totals in zip(self.groups, self.totals))
+
+
+def _map(x, projector, tol, maxiter):
+    """Plain alternating projections"""
+    for iteration in range(1, maxiter + 1):
+        x = projector.sweep(x)
+        if projector.max_group_mean(x) <= tol:
+            return x, iteration
+    return None, maxiter
+
+
+def _irons_tuck(x, projector, tol, maxiter):
+    """Extrapolate along the last two sweep differences"""
+    for iteration in range(1, maxiter + 1):
+        tx = projector.sweep(x)
+        ttx = projector.sweep(tx)
+        delta1 = ttx - tx
+        delta2 = delta1 - (tx - x)
+        denom = delta2 @ delta2
+        x = ttx - (delta1 @ delta2) / denom * delta1 if denom > 0 else ttx
+        # Extrapolated steps can be small while the result is still far off,
+        # so stop on what is left to demean rather than on the step size
+        if projector.max_group_mean(x) <= tol:
+            return x, iteration
+    return None, maxiter
+
+
+def _conjugate_gradient(x, projector, tol, maxiter):
+    """CG on (I - T) u = (I - T) x for the FE component u, T the symmetric sweep
+
+    x - u is the demeaned column. (I - T) is positive semi-definite and x's
+    FE component lies in its range, so CG converges in far fewer sweeps
+    than alternating projections on badly connected FE structures.
+    """
+    result = x.copy()
+    r = x - projector.symmetric_sweep(x)
+    p = r.copy()
+    rs = projector.dot(r, r)
+    for iteration in range(1, maxiter + 1):
+        if rs == 0:
+            return result, iteration
+        ap = p - projector.symmetric_sweep(p)
+        alpha = rs / projector.dot(p, ap)
+        result -= alpha * p
+        if projector.max_group_mean(result) <= tol:
+            return result, iteration
+        r -= alpha * ap
+        rs_new = projector.dot(r, r)
+        p = r + (rs_new / rs) * p
+        rs = rs_new
+    return None, maxiter
+
+
+_ACCELERATIONS = {None: _map, 'irons_tuck': _irons_tuck, 'cg': _conjugate_gradient}
+
+
+def demean(values, codes, weights=None, tol=1e-8, maxiter=10_000, acceleration='cg'):
+    """Partial the fixed effects in `codes` out of each column of `values`
+
+    `values` is an (n,) or (n, k) array and `codes` a list of integer-coded
+    FE arrays (see fe_codes()). `acceleration` is 'cg' (default),
+    'irons_tuck' or None for plain alternating projections. Iterates until
+    no FE group has a (weighted) mean above `tol` in absolute value. That
+    bounds what is left to demean, not the distance to the exact result,
+    which grows as the FEs get less connected. Memory is a few copies of
+    one column plus one array per FE level set.
+    """
+    if acceleration not in _ACCELERATIONS:
+        raise ValueError(f"Unknown acceleration {acceleration!r}")
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    columns = values.reshape(len(values), -1)
+    projector = _Projector(codes, weights)
+    if len(codes) == 1:
+        # A single FE is an exact projection, done for all columns at once
+        out = projector.groups[0].demean(columns, projector.weights, projector.totals[0])
+        return out[:, 0] if single else out
+    out = np.empty_like(columns)
+    for j in range(columns.shape[1]):
+        result, iterations = _ACCELERATIONS[acceleration](columns[:, j], projector, tol, maxiter)
+        if result is None:
+            raise RuntimeError(f"Fixed-effect demeaning did not converge in {iterations} iterations")
+        out[:, j] = result
+    return out[:, 0] if single else out
+
+
+class WithinOLS:
+    """Fixed-effects OLS on columns demeaned once per sample
+
+    Every column a table can use, regressors and outcomes alike, is
+    partialled for the fixed effects in a single demean() pass and cached;
+    each spec is then a fit() on the within-transformed columns through
+    NestedOLS, so no spec re-demeans, rebuilds a frame or refactors the
+    blocks it shares with earlier specs:
+
+        model = WithinOLS(sample, ['cell_id'], regressors, outcomes, cluster='cell_id')
+        benchmark = model.fit(dist_controls, trend_controls, ['messaging'])
+
+    `df` must have no missing values in these columns. Regressors the
+    fixed effects absorb (within sum of squares at most `tol` times the
+    raw one) are omitted with a warning, as xtreg and reghdfe do: they are
+    listed in `omitted`, dropped from every spec and not counted in the
+    residual degrees of freedom. Standard errors cluster on `cluster` when
+    given and are HC1 otherwise; FEs nested within the cluster use up no
+    degrees of freedom, as in xtreg, fe and reghdfe. R-squared is the
+    within R-squared.
+    """
+
+    def __init__(self, df, fe_vars, columns, outcomes, weights=None, cluster=None, tol=1e-9):
+        columns, outcomes = list(columns), list(outcomes)
+        values = df[columns + outcomes].to_numpy(dtype=float)
+        if np.isnan(values).any():
+            raise ValueError("Columns have missing values; drop those rows before WithinOLS")
+        codes = fe_codes(df, fe_vars)
+        within = demean(values, codes, weights)
+        k = len(columns)
+        w = np.ones(len(df)) if weights is None else np.asarray(weights, dtype=float)
+        raw_ss = w @ values[:, :k] ** 2
+        absorbed = w @ within[:, :k] ** 2 <= tol * raw_ss
+        self.omitted = [col for col, a in zip(columns, absorbed) if a]
+        if self.omitted:
+            warnings.warn(f"Omitted, absorbed by the fixed effects: {', '.join(self.omitted)}")
+        kept = [col for col, a in zip(columns, absorbed) if not a]
+        groups = None if cluster is None else df[cluster]
+        self.nobs = len(df)
+        self.df_absorbed = absorbed_parameters(codes, groups)
+        self.model = NestedOLS(Design(sp.csr_matrix(within[:, :k][:, ~absorbed]), kept),
+                               pd.DataFrame(within[:, k:], index=df.index, columns=outcomes),
+                               weights=weights, cov_type='HC1' if cluster is None else 'cluster',
+                               groups=groups, df_absorbed=self.df_absorbed, column_scale=raw_ss[~absorbed])
+
+    def fit(self, *blocks, outcomes=None):
+        """Fit the spec made of `blocks`, less omitted columns; see NestedOLS.fit()"""
+        blocks = [[col for col in block if col not in self.omitted] for block in blocks]
+        return self.model.fit(*blocks, outcomes=outcomes)
+
+
+def _codes_and_levels(s):
+    """Integer codes and the ID each code stands for"""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.cat.remove_unused_categories()
+        return s.cat.codes.to_numpy(), s.cat.categories
+    return pd.factorize(s)
+
+
+def recover_fixed_effects(df, fe_vars, partial_resid, atol=1e-12, btol=1e-12, maxiter=None):
+    """Estimated FE levels given already-estimated slopes
+
+    `partial_resid` is y - X @ beta on the rows of `df` (the dependent
+    variable net of the slope terms, not demeaned). Solves D a = r by LSMR
+    on the sparse CSR incidence matrix D of all FE levels, with columns
+    scaled by 1/sqrt(group size) as a preconditioner, in memory linear in
+    rows plus levels. The FEs are only identified up to normalizations
+    within connected components. LSMR returns the minimum-norm solution of
+    the scaled system, so among all solutions the effects minimize the sum
+    over every level of (group size x effect^2), not the plain norm. With
+    two FEs this means that, within each connected component, both FEs'
+    effects have the same mean over rows; compare levels across FE
+    dimensions with that normalization in mind.
+
+    Returns {fe_var: pd.Series of effects indexed by ID}.
+    """
+    r = np.asarray(partial_resid, dtype=float)
+    rows = np.arange(len(r))
+    blocks, levels = [], []
+    for var in fe_vars:
+        codes, ids = _codes_and_levels(df[var])
+        if (codes < 0).any():
+            raise ValueError(f"{var} has missing values; drop them before recovering effects")
+        blocks.append(sp.csr_matrix((np.ones(len(r)), (rows, codes)), shape=(len(r), len(ids))))
+        levels.append(ids)
+    D = sp.hstack(blocks, format='csr')
+    scale = 1 / np.sqrt(np.asarray(D.sum(axis=0)).ravel())
+    solution = lsmr(D @ sp.diags(scale), r, atol=atol, btol=btol, maxiter=maxiter)[0] * scale
+
+    effects = {}
+    offset = 0
+    for var, ids in zip(fe_vars, levels):
+        effects[var] = pd.Series(solution[offset:offset + len(ids)], index=pd.Index(ids, name=var))
+        offset += len(ids)
+    return effects
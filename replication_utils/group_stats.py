@@ -0,0 +1,95 @@
+"""
+Vectorized group statistics on integer group codes
+np.bincount for single columns and np.add.reduceat over one precomputed
+sort order for many columns at once, instead of groupby().transform(lambda)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def group_codes(values):
+    """Integer codes 0..G-1 for a column (categoricals keep their used categories)"""
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.remove_unused_categories().cat.codes.to_numpy()
+    else:
+        codes = pd.factorize(np.asarray(values))[0]
+    if (codes < 0).any():
+        raise ValueError(f"{getattr(values, 'name', 'Group column')} has missing values")
+    return codes.astype(np.intp)
+
+
+class GroupIndex:
+    """Group codes with their counts and a lazily built sort order
+
+    Statistics come back as arrays indexed by group code; broadcast() maps
+    them back to rows. Methods accept an (n,) column or an (n, k) block and
+    return (G,) or (G, k) accordingly:
+
+        groups = GroupIndex.from_values(df['EIN_state_cd_id'])
+        within = groups.demean(df[['y', 'x']].to_numpy())
+    """
+
+    def __init__(self, codes, ngroups=None):
+        self.codes = np.asarray(codes, dtype=np.intp)
+        if ngroups is None:
+            ngroups = int(self.codes.max()) + 1 if len(self.codes) else 0
+        self.ngroups = ngroups
+        self.counts = np.bincount(self.codes, minlength=ngroups)
+        self._order = None
+        self._starts = None
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(group_codes(values))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _sorted_layout(self):
+        """Row order grouping equal codes together, and where each non-empty group starts"""
+        if self._order is None:
+            self._order = np.argsort(self.codes, kind='stable')
+            present = np.flatnonzero(self.counts)
+            self._starts = (present, np.concatenate([[0], np.cumsum(self.counts[present])[:-1]]))
+        return self._order, self._starts
+
+    def sum(self, values, weights=None):
+        """Per-group (weighted) sums"""
+        values = np.asarray(values, dtype=float)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)
+            values = values * (weights if values.ndim == 1 else weights[:, None])
+        if values.ndim == 1:
+            return np.bincount(self.codes, weights=values, minlength=self.ngroups)
+        order, (present, starts) = self._sorted_layout()
+        sums = np.zeros((self.ngroups, values.shape[1]))
+        if len(present):
+            sums[present] = np.add.reduceat(values[order], starts, axis=0)
+        return sums
+
+    def count(self, weights=None):
+        """Rows per group, or total weight per group"""
+        if weights is None:
+            return self.counts
+        return np.bincount(self.codes, weights=np.asarray(weights, dtype=float), minlength=self.ngroups)
+
+    def mean(self, values, weights=None, totals=None):
+        """Per-group (weighted) means; empty or zero-weight groups get 0
+
+        `totals` lets iterative callers pass count(weights) computed once.
+        """
+        sums = self.sum(values, weights)
+        totals = self.count(weights) if totals is None else totals
+        if sums.ndim == 2:
+            totals = totals[:, None]
+        return np.divide(sums, totals, out=np.zeros_like(sums), where=totals > 0)
+
+    def broadcast(self, stats):
+        """Group statistics repeated back onto the rows"""
+        return stats[self.codes]
+
+    def demean(self, values, weights=None, totals=None):
+        """Values minus their group means, for one or many columns"""
+        values = np.asarray(values, dtype=float)
+        return values - self.broadcast(self.mean(values, weights, totals))
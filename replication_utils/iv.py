@@ -0,0 +1,139 @@
+"""
+Two-stage least squares for many outcomes at once
+Outcomes observed on the same rows share one first-stage projection
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.sparse as sp
+import scipy.stats
+
+from .design import Design
+from .covariance import sandwich
+
+
+def _inverse(a):
+    """Inverse of a symmetric positive (semi-)definite matrix"""
+    try:
+        return scipy.linalg.cho_solve(scipy.linalg.cho_factor(a), np.eye(len(a)))
+    except np.linalg.LinAlgError:
+        return np.linalg.pinv(a)
+
+
+def _robust_covs(X, E, bread):
+    """Heteroskedasticity-robust (HC0) covariance for each column of residuals E"""
+    return np.array([sandwich(bread, X.multiply(E[:, [j]]).tocsr()) for j in range(E.shape[1])])
+
+
+class IVResults:
+    """2SLS estimates for one outcome
+
+    Attribute names follow linearmodels' IV results (params, std_errors,
+    pvalues, nobs); first_stage_f holds the first-stage F statistic on the
+    excluded instruments for each endogenous regressor, computed with the
+    same covariance type as the second stage.
+    """
+
+    def __init__(self, params, cov, nobs, cov_type, first_stage_f):
+        self.params = params
+        self.cov = cov
+        self.nobs = nobs
+        self.cov_type = cov_type
+        self.first_stage_f = first_stage_f
+        self.std_errors = pd.Series(np.sqrt(np.diag(cov)), index=params.index)
+        self.tstats = self.params / self.std_errors
+        self.pvalues = pd.Series(2 * scipy.stats.norm.sf(np.abs(self.tstats)), index=params.index)
+
+
+def _as_frame(values, name):
+    frame = pd.DataFrame(values)
+    if isinstance(values, pd.Series) and values.name is None:
+        frame.columns = [name]
+    return frame
+
+
+def _fit_sample(exog, endog, instruments, Y, weights, cov_type):
+    """2SLS of every column of Y on one sample, sharing the first stage"""
+    X_exog = exog.matrix
+    n = X_exog.shape[0]
+    endog_values = endog.to_numpy(dtype=float)
+    Z_values = instruments.to_numpy(dtype=float)
+    Y_values = Y.to_numpy(dtype=float)
+    if weights is not None:
+        root_w = np.sqrt(np.asarray(weights, dtype=float))
+        X_exog = sp.diags(root_w) @ X_exog
+        endog_values = endog_values * root_w[:, None]
+        Z_values = Z_values * root_w[:, None]
+        Y_values = Y_values * root_w[:, None]
+
+    # First stage, once for the sample: project the endogenous regressors on Z
+    Z = sp.hstack([X_exog, sp.csr_matrix(Z_values)], format='csr')
+    ztz_inv = _inverse((Z.T @ Z).toarray())
+    pi = ztz_inv @ (Z.T @ endog_values)
+    fitted = Z @ pi
+    first_resid = endog_values - fitted
+    n_exog, n_instruments = X_exog.shape[1], Z_values.shape[1]
+    excluded = slice(n_exog, n_exog + n_instruments)
+    if cov_type == 'robust':
+        first_covs = _robust_covs(Z, first_resid, ztz_inv)
+    else:
+        first_covs = np.array([ztz_inv * (v @ v) / n for v in first_resid.T])
+    first_stage_f = pd.Series(
+        [pi[excluded, p] @ np.linalg.pinv(first_covs[p][excluded, excluded]) @ pi[excluded, p] / n_instruments
+         for p in range(endog_values.shape[1])], index=endog.columns)
+
+    # Second stage for all outcomes together
+    X_hat = sp.hstack([X_exog, sp.csr_matrix(fitted)], format='csr')
+    X = sp.hstack([X_exog, sp.csr_matrix(endog_values)], format='csr')
+    bread = _inverse((X_hat.T @ X_hat).toarray())
+    B = bread @ (X_hat.T @ Y_values)
+    E = Y_values - X @ B
+    if cov_type == 'robust':
+        covs = _robust_covs(X_hat, E, bread)
+    else:
+        covs = np.array([bread * (e @ e) / n for e in E.T])
+
+    names = list(exog.columns) + list(endog.columns)
+    return {outcome: IVResults(pd.Series(B[:, j], index=names), covs[j], n, cov_type, first_stage_f)
+            for j, outcome in enumerate(Y.columns)}
+
+
+def batched_2sls(exog, endog, instruments, Y, weights=None, cov_type='robust'):
+    """2SLS of each column of Y on `exog` and `endog`, instrumented by `instruments`
+
+    `exog` is a Design (constant, controls and sparse fixed effects);
+    `endog`, `instruments` and `weights` are aligned with its rows. Each
+    outcome drops its own missing rows; rows with missing or zero weight
+    are dropped for all. Outcomes with the same non-missing mask share the
+    first-stage projection and are solved together.
+    cov_type is 'robust' (HC0) or 'unadjusted', without small-sample
+    corrections, like linearmodels' IV2SLS defaults.
+
+    Returns {outcome: IVResults}; outcomes with no complete rows are left out.
+    """
+    if not isinstance(exog, Design):
+        raise TypeError("exog must be a Design from build_design()")
+    if cov_type not in ('robust', 'unadjusted'):
+        raise ValueError(f"Unknown cov_type {cov_type!r}")
+    endog = _as_frame(endog, 'endog')
+    instruments = _as_frame(instruments, 'instrument')
+    Y = pd.DataFrame(Y)
+    base = (endog.notna().all(axis=1) & instruments.notna().all(axis=1)).to_numpy()
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        # Zero-weight rows drop out of the sample, as with Stata aweights
+        base = base & (weights > 0)
+
+    samples = {}
+    for outcome in Y.columns:
+        mask = base & Y[outcome].notna().to_numpy()
+        if mask.any():
+            samples.setdefault(mask.tobytes(), (mask, []))[1].append(outcome)
+
+    results = {}
+    for mask, outcomes in samples.values():
+        subset = exog if mask.all() else Design(exog.matrix[mask], exog.columns)
+        results.update(_fit_sample(subset, endog[mask], instruments[mask], Y.loc[mask, outcomes],
+                                   None if weights is None else weights[mask], cov_type))
+    return {outcome: results[outcome] for outcome in Y.columns if outcome in results}
@@ -0,0 +1,417 @@
+"""
+Least-squares estimators for the replication scripts
+Out-of-core OLS from sufficient statistics (X'X, X'y) accumulated chunk by chunk,
+OLS/WLS on sparse fixed-effect designs, and nested specs sharing one factorization
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.sparse as sp
+import scipy.stats
+
+from .design import Design, build_design
+from .covariance import Clusters, sandwich
+
+
+def solve_normal_equations(xtx, xty):
+    """Solve X'X b = X'y by Cholesky, falling back to the pseudo-inverse if singular"""
+    try:
+        factor = scipy.linalg.cho_factor(xtx)
+        return scipy.linalg.cho_solve(factor, xty)
+    except np.linalg.LinAlgError:
+        return np.linalg.pinv(xtx) @ xty
+
+
+def _levels(s):
+    """Dummy levels in the order pd.get_dummies uses"""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return list(s.cat.categories)
+    return sorted(s.dropna().unique())
+
+
+class StreamingOLS:
+    """OLS fitted from X'X and X'y accumulated over chunks of a dataset
+
+    `categorical` maps a column to its dummy prefix; each is expanded like
+    pd.get_dummies(..., prefix=prefix, drop_first=True), so coefficient
+    names match the statsmodels fit on the dense design. Level sets must be
+    known before fitting: pass `levels`, or call collect_levels() on a
+    first pass over the chunks.
+
+    Memory is O(k^2) for k regressors regardless of the number of rows, so
+    the fit runs on datasets far larger than RAM:
+
+        model = StreamingOLS('logRev', ['logWorkers'], {'Industry': 'ind'})
+        model.collect_levels(chunks())
+        model.fit(chunks())
+        for chunk, resid in model.iter_residuals(chunks()):
+            ...
+    """
+
+    def __init__(self, dependent, regressors, categorical=None, levels=None, add_constant=True):
+        self.dependent = dependent
+        self.regressors = list(regressors)
+        self.categorical = dict(categorical or {})
+        self.levels = dict(levels or {})
+        self.add_constant = add_constant
+        self._reset()
+
+    def _reset(self):
+        self.nobs = 0
+        self._xtx = None
+        self._xty = None
+        self._yty = 0.0
+        self.params = None
+
+    def collect_levels(self, chunks):
+        """First pass: collect the levels of every categorical column"""
+        seen = {col: set() for col in self.categorical}
+        categories = {}
+        for chunk in chunks:
+            for col in self.categorical:
+                if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                    categories[col] = _levels(chunk[col])
+                else:
+                    seen[col].update(chunk[col].dropna().unique())
+        for col in self.categorical:
+            self.levels[col] = categories.get(col) or sorted(seen[col])
+        return self
+
+    @property
+    def columns(self):
+        names = ['const'] if self.add_constant else []
+        names += self.regressors
+        for col, prefix in self.categorical.items():
+            names += [f'{prefix}_{level}' for level in self.levels[col][1:]]
+        return names
+
+    def design(self, chunk):
+        """Sparse CSR design matrix for one chunk, in the order of self.columns"""
+        for col in self.categorical:
+            if (pd.Categorical(chunk[col], categories=self.levels[col]).codes < 0).any():
+                raise ValueError(f"{col} has values outside the collected levels")
+        return build_design(chunk, self.regressors, self.categorical, self.levels,
+                            add_constant=self.add_constant).matrix
+
+    def partial_fit(self, chunk):
+        """Add one chunk's contribution to X'X, X'y and y'y"""
+        missing = [col for col in self.categorical if col not in self.levels]
+        if missing:
+            raise ValueError(f"Levels unknown for {missing}; call collect_levels() first")
+        X = self.design(chunk)
+        y = chunk[self.dependent].to_numpy(dtype=float)
+        if self._xtx is None:
+            self._xtx = np.zeros((X.shape[1], X.shape[1]))
+            self._xty = np.zeros(X.shape[1])
+        self._xtx += (X.T @ X).toarray()
+        self._xty += X.T @ y
+        self._yty += y @ y
+        self.nobs += len(y)
+        return self
+
+    def fit(self, chunks):
+        """Accumulate over all chunks and solve the normal equations once"""
+        self._reset()
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        if self.nobs == 0:
+            raise ValueError("No observations to fit")
+        self.params = pd.Series(solve_normal_equations(self._xtx, self._xty), index=self.columns)
+        return self
+
+    @property
+    def ssr(self):
+        b = self.params.to_numpy()
+        return float(self._yty - 2 * b @ self._xty + b @ self._xtx @ b)
+
+    def resid(self, chunk):
+        return chunk[self.dependent].to_numpy(dtype=float) - self.design(chunk) @ self.params.to_numpy()
+
+    def iter_residuals(self, chunks):
+        """Second pass: yield (chunk, residuals) without holding the full dataset"""
+        for chunk in chunks:
+            yield chunk, self.resid(chunk)
+
+
+class SparseOLSResults:
+    """Coefficients and (robust) standard errors from sparse_ols()
+
+    Attribute names follow statsmodels' RegressionResults so scripts can
+    swap one for the other; p-values use the normal distribution for robust
+    covariances and Student t otherwise, as statsmodels does by default.
+    """
+
+    def __init__(self, params, cov, resid, nobs, df_resid, cov_type, rsquared):
+        self.params = params
+        self.cov = cov
+        self.resid = resid
+        self.nobs = float(nobs)
+        self.df_resid = df_resid
+        self.cov_type = cov_type
+        self.rsquared = rsquared
+        self.bse = pd.Series(np.sqrt(np.diag(cov)), index=params.index)
+        self.tvalues = self.params / self.bse
+        if cov_type == 'nonrobust':
+            p = 2 * scipy.stats.t.sf(np.abs(self.tvalues), df_resid)
+        else:
+            p = 2 * scipy.stats.norm.sf(np.abs(self.tvalues))
+        self.pvalues = pd.Series(p, index=params.index)
+
+    def cov_params(self):
+        return pd.DataFrame(self.cov, index=self.params.index, columns=self.params.index)
+
+    @property
+    def fvalue(self):
+        """Wald F that all slopes are zero, using the fitted covariance"""
+        slopes = self.params.index != 'const'
+        b = self.params.to_numpy()[slopes]
+        V = self.cov[np.ix_(slopes, slopes)]
+        return float(b @ np.linalg.pinv(V) @ b / np.linalg.matrix_rank(V))
+
+    def conf_int(self, alpha=0.05):
+        """Confidence intervals with the same reference distribution as the p-values"""
+        if self.cov_type == 'nonrobust':
+            q = scipy.stats.t.ppf(1 - alpha / 2, self.df_resid)
+        else:
+            q = scipy.stats.norm.ppf(1 - alpha / 2)
+        return pd.DataFrame({0: self.params - q * self.bse, 1: self.params + q * self.bse})
+
+
+def _prepare(design, Y, weights):
+    """Weighted design and outcomes (rows scaled by sqrt(w)) and each outcome's TSS"""
+    X = design.matrix
+    Y = np.asarray(Y, dtype=float).reshape(X.shape[0], -1)
+    w = np.ones(len(Y)) if weights is None else np.asarray(weights, dtype=float)
+    # Uncentered without an intercept, as in statsmodels
+    center = (w @ Y) / w.sum() if 'const' in design.columns else np.zeros(Y.shape[1])
+    tss = w @ (Y - center) ** 2
+    root_w = None
+    if weights is not None:
+        root_w = np.sqrt(w)
+        X = sp.diags(root_w) @ X
+        Y = Y * root_w[:, None]
+    return sp.csr_matrix(X), Y, root_w, tss
+
+
+def _clusters(cov_type, groups):
+    """Coded clusters for cov_type='cluster', checking the covariance type"""
+    if cov_type not in ('nonrobust', 'HC1', 'cluster'):
+        raise ValueError(f"Unknown cov_type {cov_type!r}")
+    if cov_type != 'cluster':
+        return None
+    if groups is None:
+        raise ValueError("cov_type='cluster' needs groups")
+    return Clusters(groups)
+
+
+def _covariances(X, E, xtx_inv, df_resid, cov_type, clusters):
+    """Covariance of the coefficients for each column of weighted residuals E"""
+    if cov_type == 'nonrobust':
+        ssr = (E ** 2).sum(axis=0)
+        return ssr[:, None, None] / df_resid * xtx_inv
+    return np.array([sandwich(xtx_inv, X.multiply(E[:, [j]]).tocsr(), clusters, df_resid)
+                     for j in range(E.shape[1])])
+
+
+def _fit_block(design, Y, weights, cov_type, groups, df_absorbed):
+    """Fit every column of Y (no missing values) on one design
+
+    X'X is factorized once and all outcomes are solved together; robust
+    meats come from each outcome's sparse scores (see covariance.py).
+    """
+    # Cluster codes and their intersections are built once for all outcomes
+    clusters = _clusters(cov_type, groups)
+    X, Y, root_w, tss = _prepare(design, Y, weights)
+    n, k = X.shape
+
+    xtx = (X.T @ X).toarray()
+    rank = np.linalg.matrix_rank(xtx)
+    # Cholesky can go through on a numerically singular X'X; collinear designs use the pseudo-inverse
+    try:
+        if rank < k:
+            raise np.linalg.LinAlgError("Collinear columns")
+        factor = scipy.linalg.cho_factor(xtx)
+        xtx_inv = scipy.linalg.cho_solve(factor, np.eye(k))
+    except np.linalg.LinAlgError:
+        xtx_inv = np.linalg.pinv(xtx)
+    B = xtx_inv @ (X.T @ Y)
+    E = Y - X @ B
+    ssr = (E ** 2).sum(axis=0)
+    df_resid = n - rank - df_absorbed
+    cov = _covariances(X, E, xtx_inv, df_resid, cov_type, clusters)
+
+    rsquared = 1 - ssr / tss
+    if root_w is not None:
+        E = E / root_w[:, None]
+    return [(pd.Series(B[:, j], index=design.columns), cov[j], E[:, j], rsquared[j])
+            for j in range(Y.shape[1])], n, df_resid
+
+
+def sparse_ols(design, y, weights=None, cov_type='nonrobust', groups=None, df_absorbed=0):
+    """OLS (or WLS with `weights`) on a Design with sparse dummy blocks
+
+    X'X is formed as a sparse product, so the cost is O(nnz) in the rows
+    and O(k^2) in the columns; the n x k dense design is never built.
+    cov_type is 'nonrobust', 'HC1' or 'cluster' (with `groups`), with the
+    same small-sample corrections as statsmodels and Stata. `groups` is one
+    cluster column, or a DataFrame or list of up to three for multiway
+    clustering. `df_absorbed` counts
+    parameters partialled out before the fit (demeaned fixed effects) in
+    the residual degrees of freedom.
+    """
+    if not isinstance(design, Design):
+        raise TypeError("design must be a Design from build_design()")
+    fits, n, df_resid = _fit_block(design, y, weights, cov_type, groups, df_absorbed)
+    params, cov, resid, rsquared = fits[0]
+    return SparseOLSResults(params, cov, resid, n, df_resid, cov_type, rsquared)
+
+
+def _take_rows(groups, rows):
+    """Cluster column(s) restricted to a boolean row mask"""
+    if groups is None:
+        return None
+    if isinstance(groups, pd.DataFrame):
+        return groups[rows]
+    if isinstance(groups, (list, tuple)):
+        return [np.asarray(g)[rows] for g in groups]
+    return np.asarray(groups)[rows]
+
+
+def batched_ols(design, Y, weights=None, cov_type='nonrobust', groups=None, df_absorbed=0):
+    """sparse_ols() for every column of Y, sharing the work across outcomes
+
+    Each outcome drops its own missing rows; outcomes with the same
+    missing-value pattern share one factorization of X'X and one pass for
+    their covariances. Returns {outcome: SparseOLSResults}, identical to
+    fitting each outcome separately on its complete rows.
+    """
+    if not isinstance(design, Design):
+        raise TypeError("design must be a Design from build_design()")
+    Y = pd.DataFrame(Y)
+    observed = Y.notna().to_numpy()
+    samples = {}
+    for j, outcome in enumerate(Y.columns):
+        samples.setdefault(observed[:, j].tobytes(), []).append(outcome)
+
+    results = {}
+    for outcomes in samples.values():
+        rows = Y[outcomes[0]].notna().to_numpy()
+        subset = design if rows.all() else Design(design.matrix[rows], design.columns)
+        fits, n, df_resid = _fit_block(
+            subset, Y.loc[rows, outcomes],
+            None if weights is None else np.asarray(weights, dtype=float)[rows],
+            cov_type, _take_rows(groups, rows), df_absorbed)
+        for outcome, (params, cov, resid, rsquared) in zip(outcomes, fits):
+            results[outcome] = SparseOLSResults(params, cov, resid, n, df_resid, cov_type, rsquared)
+    return {outcome: results[outcome] for outcome in Y.columns}
+
+
+class NestedOLS:
+    """OLS for nested specifications on one sample and one set of outcomes
+
+    X'X and X'Y are formed once for every column of `design`. A spec is a
+    sequence of column blocks; the Cholesky factor of each block prefix is
+    cached, and adding a block extends it through the Schur complement of
+    the new columns, so specs that share leading blocks share their
+    factorization. A table's column sequence costs one pass over the data
+    plus O(nnz) per spec for residuals and robust covariances:
+
+        model = NestedOLS(design, df[outcomes], cov_type='cluster', groups=df['branch'])
+        col1 = model.fit(base)
+        col2 = model.fit(base, ['diff_patents_gva'])
+        col3 = model.fit(base, ['diff_patents_gva'], ['difflnTFP'])
+
+    Results match batched_ols() on the same columns. A spec whose new
+    block is collinear with earlier ones is refitted directly. Collinearity
+    is judged against each column's (weighted) sum of squares, or against
+    `column_scale` when the columns were transformed first: WithinOLS
+    passes the sums of squares before demeaning, so a column the fixed
+    effects absorbed, left as rounding noise, counts as collinear.
+    """
+
+    def __init__(self, design, Y, weights=None, cov_type='nonrobust', groups=None, df_absorbed=0,
+                 column_scale=None):
+        if not isinstance(design, Design):
+            raise TypeError("design must be a Design from build_design()")
+        Y = pd.DataFrame(Y)
+        if Y.isna().any().any():
+            raise ValueError("Outcomes have missing values; drop those rows before NestedOLS")
+        self.design = design
+        self.outcomes = list(Y.columns)
+        self._outcome_frame = Y
+        self.weights = weights
+        self.cov_type = cov_type
+        self.groups = groups
+        self.df_absorbed = df_absorbed
+        self._position = {col: i for i, col in enumerate(design.columns)}
+        self._clusters = _clusters(cov_type, groups)
+        X, self._Y, self._root_w, self._tss = _prepare(design, Y, weights)
+        self._X = X.tocsc()
+        self._xtx = (X.T @ X).toarray()
+        self._xty = np.asarray(X.T @ self._Y)
+        self._scale = np.diag(self._xtx).copy()
+        if column_scale is not None:
+            self._scale = np.maximum(self._scale, np.asarray(column_scale, dtype=float))
+        self._factors = {}
+
+    def _indices(self, block):
+        missing = [col for col in block if col not in self._position]
+        if missing:
+            raise KeyError(f"Columns not in the design: {missing}")
+        return [self._position[col] for col in block]
+
+    def _factor(self, blocks):
+        """(column indices, lower Cholesky factor of their X'X) for a block prefix"""
+        if blocks in self._factors:
+            return self._factors[blocks]
+        new = self._indices(blocks[-1])
+        D = self._xtx[np.ix_(new, new)]
+        if len(blocks) == 1:
+            idx = new
+            L = L22 = np.linalg.cholesky(D)
+        else:
+            prev, L11 = self._factor(blocks[:-1])
+            if set(prev) & set(new):
+                raise ValueError(f"Columns repeated across blocks: {blocks[-1]}")
+            # [[A, C], [C', D]] = L L' with L21 = (L11^-1 C)' and L22 L22' = D - L21 L21'
+            L21 = scipy.linalg.solve_triangular(L11, self._xtx[np.ix_(prev, new)], lower=True).T
+            L22 = np.linalg.cholesky(D - L21 @ L21.T)
+            idx = prev + new
+            L = np.block([[L11, np.zeros((len(prev), len(new)))], [L21, L22]])
+        # A pivot that is tiny relative to its column's untransformed norm means a collinear column
+        if np.any(np.diag(L22) ** 2 <= 1e-10 * self._scale[new]):
+            raise np.linalg.LinAlgError("Collinear columns in block")
+        self._factors[blocks] = (idx, L)
+        return idx, L
+
+    def fit(self, *blocks, outcomes=None):
+        """Fit the spec made of `blocks` (lists of column names)
+
+        Returns {outcome: SparseOLSResults} for `outcomes` (default: all).
+        """
+        blocks = tuple(tuple(block) for block in blocks if len(block))
+        if not blocks:
+            raise ValueError("A spec needs at least one column")
+        outcomes = self.outcomes if outcomes is None else list(outcomes)
+        names = [col for block in blocks for col in block]
+        try:
+            idx, L = self._factor(blocks)
+        except np.linalg.LinAlgError:
+            subset = Design(self.design.matrix[:, self._indices(names)], names)
+            return batched_ols(subset, self._outcome_frame[outcomes], self.weights, self.cov_type,
+                               self.groups, self.df_absorbed)
+        cols = [self.outcomes.index(o) for o in outcomes]
+        xtx_inv = scipy.linalg.cho_solve((L, True), np.eye(len(idx)))
+        B = xtx_inv @ self._xty[np.ix_(idx, cols)]
+        X = self._X[:, idx].tocsr()
+        E = self._Y[:, cols] - X @ B
+        n = X.shape[0]
+        df_resid = n - len(idx) - self.df_absorbed
+        cov = _covariances(X, E, xtx_inv, df_resid, self.cov_type, self._clusters)
+        rsquared = 1 - (E ** 2).sum(axis=0) / self._tss[cols]
+        if self._root_w is not None:
+            E = E / self._root_w[:, None]
+        return {outcome: SparseOLSResults(pd.Series(B[:, j], index=names), cov[j], E[:, j], n,
+                                          df_resid, self.cov_type, rsquared[j])
+                for j, outcome in enumerate(outcomes)}
@@ -0,0 +1,39 @@
+"""
+Background dataset prefetching
+Loads and preprocesses upcoming datasets while the current estimates run
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DatasetPrefetcher:
+    """Run dataset loaders on a background thread ahead of use
+
+    Loaders run one at a time in submission order, so submitting every
+    dataset up front overlaps the I/O and preprocessing of the next panel
+    with the model fits of the current one. get() blocks until the named
+    dataset is ready and re-raises any exception from its loader.
+    """
+
+    def __init__(self, max_workers=1):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._futures = {}
+
+    def submit(self, name, loader, *args, **kwargs):
+        if name in self._futures:
+            raise ValueError(f"Dataset {name!r} already submitted")
+        self._futures[name] = self._pool.submit(loader, *args, **kwargs)
+        return self
+
+    def get(self, name):
+        # Each dataset is handed out once so the prefetcher does not keep it alive
+        return self._futures.pop(name).result()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,141 @@
+"""
+Shared-memory broadcast of dataset columns to process-pool workers
+Workers get zero-copy NumPy views instead of a pickled DataFrame each
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+_ALIGN = 64
+
+# Columns attached in this worker process by init_worker()
+_worker_data = None
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _column_values(s):
+    """Numeric values of a column; categoricals are published as their integer codes"""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy()
+    if not (pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s)):
+        raise TypeError(f"Column {s.name!r} is not numeric ({s.dtype})")
+    if pd.api.types.is_extension_array_dtype(s.dtype):
+        # Nullable ints/floats: missing values become NaN
+        return s.to_numpy(dtype=float, na_value=np.nan)
+    return s.to_numpy()
+
+
+def _attach_block(name):
+    """Attach to an existing block without letting this process unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Python < 3.13 registers every attachment with the resource tracker, which
+    # would unlink the block when the first worker exits; skip the registration
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedFrame:
+    """Numeric columns of a DataFrame published in one shared-memory block
+
+    The publishing process owns the block: use it as a context manager (or
+    call close()) so the block is unlinked once the pool is done. `spec` is
+    a small picklable description that workers pass to attach() or
+    init_worker() to get read-only NumPy views of the same memory.
+    """
+
+    def __init__(self, df, columns=None):
+        columns = list(df.columns if columns is None else columns)
+        values = {c: _column_values(df[c]) for c in columns}
+
+        layout = []
+        offset = 0
+        for c in columns:
+            offset = _aligned(offset)
+            layout.append((c, values[c].dtype.str, offset))
+            offset += values[c].nbytes
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.spec = {'name': self._shm.name, 'nrows': len(df), 'layout': layout}
+
+        for c, dtype, start in layout:
+            view = np.ndarray(len(df), dtype=dtype, buffer=self._shm.buf, offset=start)
+            view[:] = values[c]
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SharedColumns:
+    """Read-only views of a published SharedFrame inside a worker"""
+
+    def __init__(self, spec):
+        self._shm = _attach_block(spec['name'])
+        self.nrows = spec['nrows']
+        self.arrays = {}
+        for c, dtype, start in spec['layout']:
+            view = np.ndarray(self.nrows, dtype=dtype, buffer=self._shm.buf, offset=start)
+            view.flags.writeable = False
+            self.arrays[c] = view
+
+    def __getitem__(self, column):
+        return self.arrays[column]
+
+    def __contains__(self, column):
+        return column in self.arrays
+
+    def close(self):
+        self.arrays = {}
+        self._shm.close()
+
+
+def attach(spec):
+    """Zero-copy views of a SharedFrame from its spec"""
+    return SharedColumns(spec)
+
+
+def init_worker(spec):
+    """Pool initializer: attach once per worker process"""
+    global _worker_data
+    _worker_data = SharedColumns(spec)
+
+
+def worker_data():
+    """Columns attached by init_worker() in this process"""
+    if _worker_data is None:
+        raise RuntimeError("No shared dataset attached; pass init_worker as the pool initializer")
+    return _worker_data
+
+
+def process_pool(max_workers=None, initializer=None, initargs=()):
+    """ProcessPoolExecutor that forks where the platform allows it
+
+    Forked workers do not re-import the calling script, so replication
+    scripts without a __main__ guard are not re-run in every worker. Start
+    pools only once background loader threads have finished.
+    """
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers or os.cpu_count() or 1, mp_context=context,
+                               initializer=initializer, initargs=initargs)
@@ -0,0 +1,400 @@
+"""
+Stata input helpers
+Parquet cache in front of pd.read_stata so each .dta file is parsed only once,
+a column-projected, row-filtered reader for wide files, and header-only
+metadata / single-pass summary statistics for exploring new datasets
+"""
+
+import hashlib
+import json
+import operator
+import os
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .dtypes import normalize_dtypes
+
+CACHE_DIRNAME = '.stata_cache'
+CACHE_VERSION = 1
+
+# read_stata options that change the parsed frame and therefore the cache key
+_CACHE_KEY_OPTIONS = ('convert_dates', 'convert_categoricals', 'convert_missing',
+                      'preserve_dtypes', 'order_categoricals')
+
+# Row filters use the pyarrow/pd.read_parquet convention: [(column, op, value), ...]
+_FILTER_OPS = {
+    '==': operator.eq,
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda s, v: s.isin(v),
+    'not in': lambda s, v: ~s.isin(v),
+}
+
+
+def _file_sha256(path, blocksize=1 << 20):
+    """Content hash of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(path, cache_dir, options):
+    """Parquet and manifest locations for a source file and option set"""
+    cache_dir = Path(cache_dir) if cache_dir is not None else path.parent / CACHE_DIRNAME
+    tag = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:8]
+    stem = f'{path.name}.{tag}'
+    return cache_dir / f'{stem}.parquet', cache_dir / f'{stem}.json'
+
+
+def _load_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest, manifest_path):
+    tmp_manifest = manifest_path.with_suffix('.json.tmp')
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, manifest_path)
+
+
+def _is_fresh(path, manifest, manifest_path):
+    """Check a manifest against the source file (size, mtime, then content hash)"""
+    if manifest is None or manifest.get('version') != CACHE_VERSION:
+        return False
+    stat = path.stat()
+    if stat.st_size != manifest['size']:
+        return False
+    if stat.st_mtime_ns == manifest['mtime_ns']:
+        return True
+    # Same size but touched: only rebuild if the bytes actually changed
+    if _file_sha256(path) != manifest['sha256']:
+        return False
+    # Unchanged bytes: record the new mtime so later reads skip the hash
+    manifest['mtime_ns'] = stat.st_mtime_ns
+    try:
+        _write_manifest(manifest, manifest_path)
+    except OSError as e:
+        warnings.warn(f"Could not update Stata cache manifest {manifest_path}: {e}")
+    return True
+
+
+def _encode_value_labels(value_labels):
+    # JSON keys must be strings, so keep each label set as a list of pairs
+    # (Stata label values are integers, but arrive as numpy scalars)
+    return {name: [[int(key), label] for key, label in labels.items()]
+            for name, labels in value_labels.items()}
+
+
+def _decode_value_labels(value_labels):
+    return {name: {key: label for key, label in pairs}
+            for name, pairs in value_labels.items()}
+
+
+def _parse_stata(path, options):
+    """Parse a .dta file and collect its variable and value labels"""
+    with pd.read_stata(path, iterator=True, **options) as reader:
+        df = reader.read()
+        variable_labels = reader.variable_labels()
+        value_labels = reader.value_labels()
+    return df, variable_labels, value_labels
+
+
+def _write_cache(path, df, variable_labels, value_labels, parquet_path, manifest_path):
+    """Write the parquet file and its manifest atomically"""
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    stat = path.stat()
+    manifest = {
+        'version': CACHE_VERSION,
+        'source': str(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': _file_sha256(path),
+        'variable_labels': variable_labels,
+        'value_labels': _encode_value_labels(value_labels),
+    }
+    tmp_parquet = parquet_path.with_suffix('.parquet.tmp')
+    df.to_parquet(tmp_parquet, engine='pyarrow', index=False)
+    os.replace(tmp_parquet, parquet_path)
+    _write_manifest(manifest, manifest_path)
+
+
+def _fresh_cache(path, cache_dir, options):
+    """Return (parquet_path, manifest) for an up-to-date cache, else None"""
+    parquet_path, manifest_path = _cache_paths(path, cache_dir, options)
+    manifest = _load_manifest(manifest_path)
+    if parquet_path.exists() and _is_fresh(path, manifest, manifest_path):
+        return parquet_path, manifest
+    return None
+
+
+def _attach_labels(df, manifest):
+    df.attrs['variable_labels'] = manifest['variable_labels']
+    df.attrs['value_labels'] = _decode_value_labels(manifest['value_labels'])
+    return df
+
+
+def read_stata_cached(path, columns=None, cache_dir=None, use_cache=True,
+                      id_columns=None, float32=False, **options):
+    """Read a .dta file through an on-disk Parquet cache
+
+    The first read parses the Stata file and writes <cache_dir>/<name>.parquet
+    plus a JSON manifest with the source size, mtime and SHA-256, and the
+    variable/value labels. Later reads are served from Parquet while the
+    source is unchanged. Categoricals survive the round trip, and the labels
+    are exposed as df.attrs['variable_labels'] and df.attrs['value_labels'].
+
+    Any cache problem (pyarrow missing, unwritable directory, corrupt file)
+    falls back to a plain pd.read_stata with a warning.
+
+    Passing id_columns (or float32=True) runs normalize_dtypes on the result.
+    """
+    path = Path(path)
+    unknown = set(options) - set(_CACHE_KEY_OPTIONS)
+    if unknown:
+        raise TypeError(f"Unsupported read_stata options: {sorted(unknown)}")
+
+    df = _read_stata_cached(path, columns, cache_dir, use_cache, options)
+    if id_columns or float32:
+        df = normalize_dtypes(df, id_columns or (), float32=float32, name=path.name)
+    return df
+
+
+def _read_stata_cached(path, columns, cache_dir, use_cache, options):
+    if not use_cache or os.environ.get('REPLICATION_NO_CACHE'):
+        df, variable_labels, value_labels = _parse_stata(path, options)
+        df.attrs['variable_labels'] = variable_labels
+        df.attrs['value_labels'] = value_labels
+        return df[columns] if columns is not None else df
+
+    cached = _fresh_cache(path, cache_dir, options)
+    if cached is not None:
+        parquet_path, manifest = cached
+        try:
+            df = pd.read_parquet(parquet_path, engine='pyarrow', columns=columns)
+            return _attach_labels(df, manifest)
+        except Exception as e:
+            warnings.warn(f"Ignoring unreadable cache {parquet_path}: {e}")
+
+    # Cache miss or stale cache: parse the .dta and (re)build the cache
+    parquet_path, manifest_path = _cache_paths(path, cache_dir, options)
+    df, variable_labels, value_labels = _parse_stata(path, options)
+    try:
+        _write_cache(path, df, variable_labels, value_labels, parquet_path, manifest_path)
+    except Exception as e:
+        warnings.warn(f"Could not write Stata cache for {path.name}: {e}")
+    df.attrs['variable_labels'] = variable_labels
+    df.attrs['value_labels'] = value_labels
+    return df[columns] if columns is not None else df
+
+
+def _variable_labels(path):
+    with pd.read_stata(path, iterator=True) as reader:
+        return reader.variable_labels()
+
+
+def stata_columns(path):
+    """Variable names of a .dta file, read from the header only"""
+    return list(_variable_labels(path))
+
+
+def _filter_mask(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        mask &= np.asarray(_FILTER_OPS[op](df[column], value), dtype=bool)
+    return mask
+
+
+def read_stata_filtered(path, columns, filters=None, chunksize=50_000, nrows=None,
+                        cache_dir=None, id_columns=None, float32=False, **options):
+    """Read only the listed columns of the rows that pass `filters`
+
+    `filters` is a list of (column, op, value) tuples combined with AND, e.g.
+    [('mainsample', '==', 1)]. Columns not present in the file are skipped,
+    so callers can keep their `if var in df.columns` checks.
+
+    When read_stata_cached has already built a fresh Parquet cache, the
+    projection and filters are pushed down to pyarrow. Otherwise the .dta
+    is streamed in chunks of `chunksize` rows and each chunk is reduced to
+    the requested columns and matching rows before the next one is parsed,
+    so peak memory follows the size of the result, not of the file.
+    With `nrows`, streaming stops once that many matching rows are found.
+
+    Passing id_columns (or float32=True) runs normalize_dtypes on the result.
+    """
+    path = Path(path)
+    unknown = set(options) - set(_CACHE_KEY_OPTIONS)
+    if unknown:
+        raise TypeError(f"Unsupported read_stata options: {sorted(unknown)}")
+    filters = list(filters or [])
+    for _, op, _ in filters:
+        if op not in _FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator: {op!r}")
+
+    available = set(stata_columns(path))
+    columns = [c for c in dict.fromkeys(columns) if c in available]
+    filter_columns = [c for c, _, _ in filters]
+    missing = [c for c in filter_columns if c not in available]
+    if missing:
+        raise KeyError(f"Filter columns not in {path.name}: {missing}")
+    needed = list(dict.fromkeys(columns + filter_columns))
+
+    cached = None if os.environ.get('REPLICATION_NO_CACHE') else _fresh_cache(path, cache_dir, options)
+    if cached is not None:
+        parquet_path, manifest = cached
+        try:
+            df = pd.read_parquet(parquet_path, engine='pyarrow', columns=needed,
+                                 filters=filters or None)
+            df = df[columns].reset_index(drop=True)
+            df = _attach_labels(df.head(nrows) if nrows is not None else df, manifest)
+        except Exception as e:
+            warnings.warn(f"Ignoring unreadable cache {parquet_path}: {e}")
+            cached = None
+    if cached is None:
+        df = _stream_filtered(path, columns, filters, chunksize, nrows, options)
+
+    if id_columns or float32:
+        df = normalize_dtypes(df, id_columns or (), float32=float32, name=path.name)
+    return df
+
+
+def _stream_chunks(path, columns, filters, chunksize, options):
+    """Yield the matching rows of each chunk, restricted to `columns` plus filter columns"""
+    needed = list(dict.fromkeys(list(columns) + [c for c, _, _ in filters]))
+    with pd.read_stata(path, columns=needed, chunksize=chunksize, **options) as reader:
+        for chunk in reader:
+            if filters:
+                chunk = chunk.loc[_filter_mask(chunk, filters)]
+            yield chunk[list(columns)]
+
+
+def iter_stata_chunks(path, columns, filters=None, chunksize=50_000, cache_dir=None, **options):
+    """Iterate over a .dta file in chunks of the listed columns and matching rows
+
+    Reads Parquet record batches when a fresh cache exists, otherwise
+    streams the .dta itself. Used by estimators that make several passes
+    over data too large to load at once.
+    """
+    path = Path(path)
+    filters = list(filters or [])
+    cached = None if os.environ.get('REPLICATION_NO_CACHE') else _fresh_cache(path, cache_dir, options)
+    if cached is None:
+        yield from _stream_chunks(path, columns, filters, chunksize, options)
+        return
+
+    import pyarrow.parquet as pq
+
+    needed = list(dict.fromkeys(list(columns) + [c for c, _, _ in filters]))
+    parquet = pq.ParquetFile(cached[0])
+    for batch in parquet.iter_batches(batch_size=chunksize, columns=needed):
+        chunk = batch.to_pandas()
+        if filters:
+            chunk = chunk.loc[_filter_mask(chunk, filters)]
+        yield chunk[list(columns)]
+
+
+def _stream_filtered(path, columns, filters, chunksize, nrows, options):
+    """Chunked pd.read_stata pass keeping only matching rows of `columns`"""
+    pieces = []
+    found = 0
+    for chunk in _stream_chunks(path, columns, filters, chunksize, options):
+        pieces.append(chunk)
+        found += len(chunk)
+        if nrows is not None and found >= nrows:
+            break
+    df = pd.concat(pieces, ignore_index=True) if pieces else pd.DataFrame(columns=columns)
+    if nrows is not None:
+        df = df.head(nrows)
+    variable_labels = _variable_labels(path)
+    df.attrs['variable_labels'] = {c: variable_labels.get(c, '') for c in columns}
+    return df
+
+
+def stata_metadata(path):
+    """Variable names, storage dtypes and labels of a .dta file
+
+    Only the header and the first observation are read, so this is cheap
+    even for very large files.
+    """
+    with pd.read_stata(path, iterator=True) as reader:
+        labels = reader.variable_labels()
+        first = reader.read(1)
+    return pd.DataFrame({
+        'variable': list(labels),
+        'dtype': [str(first[c].dtype) for c in labels],
+        'label': list(labels.values()),
+    })
+
+
+def _combine_moments(a, b):
+    """Merge (count, mean, M2) summaries of two samples (Chan et al.)"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return a
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n
+
+
+def stata_column_stats(path, columns, filters=None, chunksize=50_000, **options):
+    """Mean, std, min, max, non-missing count and nunique in one streaming pass
+
+    Each chunk is reduced to per-column moments and a set of distinct
+    values, so only one chunk of the requested columns is in memory at a
+    time. Filters work as in read_stata_filtered. Mean and std are NaN for
+    non-numeric columns; std uses ddof=1 like pandas.
+    """
+    path = Path(path)
+    filters = list(filters or [])
+    available = set(stata_columns(path))
+    columns = [c for c in dict.fromkeys(columns) if c in available]
+
+    moments = {c: (0, 0.0, 0.0) for c in columns}
+    extremes = {c: (None, None) for c in columns}
+    distinct = {c: set() for c in columns}
+    for chunk in _stream_chunks(path, columns, filters, chunksize, options):
+        for c in columns:
+            s = chunk[c].dropna()
+            if s.empty:
+                continue
+            distinct[c].update(s.unique())
+            lo, hi = extremes[c]
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                lo = s.min() if lo is None else min(lo, s.min())
+                hi = s.max() if hi is None else max(hi, s.max())
+                extremes[c] = (lo, hi)
+            if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+                values = s.to_numpy(dtype=float)
+                mean = values.mean()
+                chunk_moments = (values.size, mean, ((values - mean) ** 2).sum())
+                moments[c] = _combine_moments(moments[c], chunk_moments)
+            else:
+                n, _, _ = moments[c]
+                moments[c] = (n + len(s), np.nan, np.nan)
+
+    rows = []
+    for c in columns:
+        n, mean, m2 = moments[c]
+        rows.append({
+            'variable': c,
+            'mean': mean if n else np.nan,
+            'std': np.sqrt(m2 / (n - 1)) if n > 1 else np.nan,
+            'min': extremes[c][0],
+            'max': extremes[c][1],
+            'non_missing': n,
+            'nunique': len(distinct[c]),
+        })
+    return pd.DataFrame(rows).set_index('variable')